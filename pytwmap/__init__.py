@@ -1,6 +1,8 @@
 from pytwmap.twmap import TWMap as TWMap
 
 from pytwmap.constants import GameTileType as GameTileType
+from pytwmap.constants import CollisionFlag as CollisionFlag
+from pytwmap.constants import TeleTileType as TeleTileType
 
 from pytwmap.tilemanager import TileManager as TileManager
 from pytwmap.tilemanager import VanillaTileManager as VanillaTileManager
@@ -8,16 +10,47 @@ from pytwmap.tilemanager import TeleTileManager as TeleTileManager
 from pytwmap.tilemanager import SpeedupTileManager as SpeedupTileManager
 from pytwmap.tilemanager import SwitchTileManager as SwitchTileManager
 from pytwmap.tilemanager import TuneTileManager as TuneTileManager
+from pytwmap.tilemanager import TileRegions as TileRegions
+from pytwmap.tilemanager import label_mask as label_mask
+
+from pytwmap.pyramid import TilePyramid as TilePyramid
 
 from pytwmap.items import Item as Item
 from pytwmap.items import ItemVersion as ItemVersion
 from pytwmap.items import ItemInfo as ItemInfo
 from pytwmap.items import ItemImage as ItemImage
 from pytwmap.items import ItemImageInternal as ItemImageInternal
-# from pytwmap.items import ItemEnvelope as ItemEnvelope
+from pytwmap.items import ItemRaw as ItemRaw
+from pytwmap.items import ItemEnvelope as ItemEnvelope
 from pytwmap.items import ItemLayer as ItemLayer
 from pytwmap.items import ItemTileLayer as ItemTileLayer
 from pytwmap.items import ItemQuadLayer as ItemQuadLayer
-# from pytwmap.items import SoundLayer as SoundLayer
+from pytwmap.items import ItemQuad as ItemQuad
+from pytwmap.items import QuadBuffer as QuadBuffer
+from pytwmap.items import ItemSoundLayer as ItemSoundLayer
 from pytwmap.items import ItemGroup as ItemGroup
-# from pytwmap.items import ItemSound as ItemSound
+from pytwmap.items import ItemSound as ItemSound
+
+from pytwmap.metadata import MapMetadata as MapMetadata
+from pytwmap.metadata import GroupMetadata as GroupMetadata
+from pytwmap.metadata import LayerMetadata as LayerMetadata
+from pytwmap.metadata import ImageMetadata as ImageMetadata
+from pytwmap.metadata import DataBlockMetadata as DataBlockMetadata
+
+from pytwmap.diff import diff_maps as diff_maps
+from pytwmap.diff import diff_tiles as diff_tiles
+from pytwmap.diff import create_patch as create_patch
+from pytwmap.diff import apply_patch as apply_patch
+from pytwmap.diff import MapDiff as MapDiff
+from pytwmap.diff import LayerDiff as LayerDiff
+from pytwmap.diff import Rect as Rect
+
+from pytwmap.automapper import Automapper as Automapper
+from pytwmap.automapper import AutomapperConfig as AutomapperConfig
+
+from pytwmap.collision import CollisionMap as CollisionMap
+from pytwmap.collision import RayHits as RayHits
+
+from pytwmap.analysis import distance_field as distance_field
+from pytwmap.analysis import analyze_reachability as analyze_reachability
+from pytwmap.analysis import Reachability as Reachability
@@ -0,0 +1,158 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from pytwmap.collision import CollisionMap
+from pytwmap.constants import CollisionFlag, GameTileType, TeleTileType
+from pytwmap.tilemanager import label_mask
+from pytwmap.twmap import TWMap
+
+
+class Reachability(NamedTuple):
+    distances: np.ndarray  # -1 for tiles that can not be reached
+    finishes: np.ndarray  # (x, y) rows
+    unreachable_finishes: np.ndarray
+    shortest_path: Optional[int]  # to the closest finish tile
+    isolated_regions: np.ndarray  # labels of the passable regions that can not be reached, 0 elsewhere
+    num_isolated_regions: int
+
+
+def _neighbour_offsets(width: int, connectivity: int):
+    assert connectivity in [4, 8]
+    offsets = [-1, 1, -width, width]
+    if connectivity == 8:
+        offsets += [-width - 1, -width + 1, width - 1, width + 1]
+    return np.array(offsets, dtype=np.int64)
+
+
+def _tile_ids(twmap: TWMap):
+    ids = [twmap.game_layer.tiles.read_array()['id']]
+    if twmap.front_layer is not None:
+        ids.append(twmap.front_layer.tiles.read_array()['id'])
+    return ids
+
+
+def _costs(twmap: TWMap, freeze_cost: Optional[int]):
+    # steps to enter each tile, 0 for tiles that can not be passed
+    assert freeze_cost is None or freeze_cost > 0
+    collision = CollisionMap(twmap)
+    freeze = np.logical_or.reduce([np.isin(ids, [GameTileType.FREEZE, GameTileType.DFREEZE]) for ids in _tile_ids(twmap)])
+    costs = np.ones(collision.flags.shape, dtype=np.int32)
+    costs[freeze] = freeze_cost if freeze_cost is not None else 0
+    costs[collision.flags & (CollisionFlag.SOLID | CollisionFlag.DEATH) != 0] = 0
+    return costs
+
+
+def _teleports(twmap: TWMap, shape: 'tuple[int, int]'):
+    # numbers of the tele in tiles in the padded grid, -1 elsewhere, and the tele out tiles
+    # of every number, checkpoint teleporters depend on the run and are ignored
+    tele_numbers = np.full((shape[0] + 2) * (shape[1] + 2), -1, dtype=np.int64)
+    if twmap.tele_layer is None:
+        return tele_numbers, {}
+
+    tele = twmap.tele_layer.tiles.read_array()
+    types, numbers = np.pad(tele['type'], 1).ravel(), np.pad(tele['number'], 1).ravel()
+    ins = np.isin(types, [TeleTileType.TELEIN, TeleTileType.TELEINEVIL])
+    tele_numbers[ins] = numbers[ins]
+    outs = np.flatnonzero(types == TeleTileType.TELEOUT)
+    tele_outs = {int(number): outs[numbers[outs] == number] for number in np.unique(numbers[outs])}
+    return tele_numbers, tele_outs
+
+
+def distance_field(twmap: TWMap,
+                   sources: Optional[np.ndarray] = None,
+                   connectivity: int = 4,
+                   freeze_cost: Optional[int] = None):
+    """
+    Returns the number of steps from the closest source tile to every tile, -1 if it can not be reached.
+
+    The sources default to the start tiles. Solid and death tiles can not be passed,
+    freeze tiles cost freeze_cost steps, they can not be passed if it is None.
+    Entering a tele in tile moves to all tele out tiles of its number.
+    """
+    return _distance_field(twmap, _costs(twmap, freeze_cost), sources, connectivity)
+
+
+def _distance_field(twmap: TWMap, costs: np.ndarray, sources: Optional[np.ndarray], connectivity: int):
+    height, width = costs.shape
+    if sources is None:
+        sources = np.logical_or.reduce([ids == GameTileType.TILE_START for ids in _tile_ids(twmap)])
+    assert sources.shape == (height, width)
+
+    # the grid is padded with blocked tiles so neighbours never wrap around,
+    # blocked tiles cost so much that they are never entered
+    unreached = np.int32(1 << 30)
+    costs = np.pad(costs, 1).ravel()
+    costs[costs == 0] = unreached
+    padded_width = width + 2
+    offsets = _neighbour_offsets(padded_width, connectivity)
+    tele_numbers, tele_outs = _teleports(twmap, (height, width))
+    step_costs = np.unique(costs[costs < unreached]).tolist()
+
+    distances = np.full(costs.shape, unreached, dtype=np.int32)
+    starts = np.flatnonzero(np.pad(sources, 1).ravel() & (costs < unreached))
+    distances[starts] = 0
+    buckets: dict[int, list[np.ndarray]] = {0: [starts]}
+
+    # marks the first occurrence of tiles reached from several cells
+    first_seen = np.zeros(costs.shape, dtype=np.int64)
+
+    # dijkstra with a bucket per distance, each bucket is expanded at once
+    while buckets:
+        distance = min(buckets)
+        cells = np.concatenate(buckets.pop(distance))
+        cells = cells[distances[cells] == distance]
+
+        while len(cells):
+            teleporting = tele_numbers[cells] >= 0
+            tele_cells, walking = cells[teleporting], cells[~teleporting]
+
+            # the distance of a tile only depends on its own cost,
+            # so tiles reached from several cells get the same distance
+            neighbours = (walking[:, np.newaxis] + offsets).ravel()
+            new_distances = distance + costs[neighbours]
+            improved = new_distances < distances[neighbours]
+            neighbours, new_distances = neighbours[improved], new_distances[improved]
+            positions = np.arange(len(neighbours))
+            first_seen[neighbours] = positions
+            first = first_seen[neighbours] == positions
+            neighbours, new_distances = neighbours[first], new_distances[first]
+
+            distances[neighbours] = new_distances
+            if len(step_costs) == 1:
+                buckets.setdefault(distance + step_costs[0], []).append(neighbours)
+            else:
+                for step_cost in step_costs:
+                    buckets.setdefault(distance + step_cost, []).append(neighbours[new_distances == distance + step_cost])
+
+            # teleporting takes no step, the tele out tiles are expanded in the same bucket
+            cells = np.zeros(0, dtype=np.int64)
+            if len(tele_cells):
+                targets = [tele_outs[number] for number in np.unique(tele_numbers[tele_cells]).tolist() if number in tele_outs]
+                if targets:
+                    cells = np.unique(np.concatenate(targets))
+                    cells = cells[(costs[cells] < unreached) & (distances[cells] > distance)]
+                    distances[cells] = distance
+
+    distances[distances == unreached] = -1
+    return distances.reshape(height + 2, padded_width)[1:-1, 1:-1]
+
+
+def analyze_reachability(twmap: TWMap, connectivity: int = 4, freeze_cost: Optional[int] = None):
+    """Checks which finish tiles and passable regions can be reached from the start tiles."""
+    costs = _costs(twmap, freeze_cost)
+    distances = _distance_field(twmap, costs, None, connectivity)
+    finish = np.logical_or.reduce([ids == GameTileType.TILE_FINISH for ids in _tile_ids(twmap)])
+    finish_y, finish_x = np.nonzero(finish)
+    reached = distances[finish_y, finish_x] >= 0
+
+    regions = label_mask((costs > 0) & (distances < 0), connectivity)
+
+    return Reachability(
+        distances=distances,
+        finishes=np.stack([finish_x, finish_y], axis=1),
+        unreachable_finishes=np.stack([finish_x[~reached], finish_y[~reached]], axis=1),
+        shortest_path=int(distances[finish_y, finish_x][reached].min()) if reached.any() else None,
+        isolated_regions=regions.labels,
+        num_isolated_regions=regions.count
+    )
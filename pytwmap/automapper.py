@@ -0,0 +1,343 @@
+import os
+from typing import List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from pytwmap.constants import TileFlag
+from pytwmap.items import ItemTileLayer
+from pytwmap.tilemanager import VanillaTileManager
+
+
+HASH_MAX = 65536
+
+# flags that are compared by the rules, OPAQUE is ignored
+_ORIENTATION_FLAGS = TileFlag.VFLIP | TileFlag.HFLIP | TileFlag.ROTATE
+
+_FLAG_NAMES = {
+    'XFLIP': TileFlag.VFLIP,
+    'YFLIP': TileFlag.HFLIP,
+    'ROTATE': TileFlag.ROTATE
+}
+
+
+class IndexInfo(NamedTuple):
+    id: int
+    flags: int = 0
+    test_flags: bool = False
+
+
+class PosRule(NamedTuple):
+    x: int
+    y: int
+    not_index: bool  # the tile must not match any of the indices
+    indices: List[IndexInfo]
+
+
+class IndexRule:
+    def __init__(self, id: int, flags: int = 0):
+        self.id = id
+        self.flags = flags
+        self.rules: list[PosRule] = []
+        self.random_probability = np.float32(1.0)
+        self.default_rule = True
+
+        # shortcuts for rules that can only match empty or full tiles
+        self.skip_empty = False
+        self.skip_full = False
+
+    def __repr__(self):
+        return f'<index_rule: {self.id}>'
+
+
+class AutomapperRun:
+    def __init__(self):
+        self.index_rules: list[IndexRule] = []
+
+        # without a copy the rules see the tiles changed before in the same run
+        self.layer_copy = True
+
+
+class AutomapperConfig:
+    def __init__(self, name: str):
+        self.name = name
+        self.runs: list[AutomapperRun] = [AutomapperRun()]
+
+    def __repr__(self):
+        return f'<automapper_config: {self.name}>'
+
+
+def _hash_uint(x: int):
+    x = (((x >> 16) ^ x) * 0x45d9f3b) & 0xffffffff
+    x = (((x >> 16) ^ x) * 0x45d9f3b) & 0xffffffff
+    return (x >> 16) ^ x
+
+
+def _hash_uint_array(x: np.ndarray):
+    # uint32 arrays wrap around like the unsigned ints of the editor
+    x = ((x >> 16) ^ x) * np.uint32(0x45d9f3b)
+    x = ((x >> 16) ^ x) * np.uint32(0x45d9f3b)
+    return (x >> 16) ^ x
+
+
+def _hash_rule(seed: int, run: int, rule: int):
+    # the part of HashLocation that is the same for all tiles
+    prime = 31
+    hash_value = 1
+    for value in [seed, run, rule]:
+        hash_value = (hash_value * prime + _hash_uint(value & 0xffffffff)) & 0xffffffff
+    return hash_value * prime & 0xffffffff
+
+
+def _hash_location_uint(rule_hash: int, x: int, y: int):
+    # HashLocation for a single tile with python ints
+    hash_value = (rule_hash + _hash_uint(x & 0xffffffff)) & 0xffffffff
+    hash_value = (hash_value * 31 + _hash_uint(y & 0xffffffff)) & 0xffffffff
+    return _hash_uint(hash_value * 31 & 0xffffffff) % HASH_MAX
+
+
+def _hash_location(seed: int, run: int, rule: int, xs: np.ndarray, ys: np.ndarray):
+    # same values as HashLocation of the ddnet editor
+    prime = 31
+    hashes = np.uint32(_hash_rule(seed, run, rule)) + _hash_uint_array(xs.astype(np.uint32))
+    hashes = hashes * np.uint32(prime) + _hash_uint_array(ys.astype(np.uint32))
+    hashes = _hash_uint_array(hashes * np.uint32(prime))
+    return hashes % HASH_MAX
+
+
+class Automapper:
+    def __init__(self, configs: 'Optional[list[AutomapperConfig]]' = None):
+        self.configs = configs if configs is not None else []
+
+    @classmethod
+    def from_file(cls, path: 'Union[str, os.PathLike[str]]'):
+        with open(path, encoding='utf8') as f:
+            return cls.parse(f.read())
+
+    @classmethod
+    def parse(cls, rules: str):
+        """Parses the content of a ddnet .rules file."""
+        automapper = cls()
+        config: Optional[AutomapperConfig] = None
+        index_rule: Optional[IndexRule] = None
+
+        for line in rules.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            words = line.split()
+            if line.startswith('[') and line.endswith(']'):
+                config = AutomapperConfig(line[1:-1])
+                automapper.configs.append(config)
+                index_rule = None
+            elif config is None:
+                continue
+            elif words[0] == 'NewRun':
+                config.runs.append(AutomapperRun())
+                index_rule = None
+            elif words[0] == 'Index' and len(words) > 1:
+                flags = 0
+                for word in words[2:]:
+                    flags |= _FLAG_NAMES.get(word, 0)
+                index_rule = IndexRule(int(words[1]), flags)
+                config.runs[-1].index_rules.append(index_rule)
+            elif words[0] == 'NoLayerCopy':
+                config.runs[-1].layer_copy = False
+            elif index_rule is None:
+                continue
+            elif words[0] == 'Pos' and len(words) > 3:
+                cls._parse_pos(index_rule, int(words[1]), int(words[2]), words[3], words[4:])
+            elif words[0] == 'Random' and len(words) > 1:
+                value = np.float32(words[1].rstrip('%'))
+                if '%' in line:
+                    index_rule.random_probability = value / np.float32(100)
+                else:
+                    index_rule.random_probability = np.float32(1) / value
+            elif words[0] == 'NoDefaultRule':
+                index_rule.default_rule = False
+
+        for config in automapper.configs:
+            for run in config.runs:
+                for rule in run.index_rules:
+                    cls._add_default_rule(rule)
+
+        return automapper
+
+    @staticmethod
+    def _parse_index_list(words: 'list[str]'):
+        indices: list[IndexInfo] = []
+        i = 0
+        while i < len(words):
+            id = int(words[i])
+            flags = 0
+            test_flags = False
+            i += 1
+            while i < len(words):
+                word = words[i]
+                i += 1
+                if word == 'OR':
+                    break
+                elif word == 'NONE':
+                    test_flags = True
+                elif word in _FLAG_NAMES:
+                    test_flags = True
+                    flags |= _FLAG_NAMES[word]
+            indices.append(IndexInfo(id, flags, test_flags))
+        return indices
+
+    @classmethod
+    def _parse_pos(cls, index_rule: IndexRule, x: int, y: int, value: str, words: 'list[str]'):
+        if value == 'EMPTY':
+            not_index, indices = False, [IndexInfo(0)]
+        elif value == 'FULL':
+            not_index, indices = True, [IndexInfo(0)]
+        elif value in ['INDEX', 'NOTINDEX']:
+            not_index, indices = value == 'NOTINDEX', cls._parse_index_list(words)
+        else:
+            return
+
+        index_rule.rules.append(PosRule(x, y, not_index, indices))
+
+        if x == 0 and y == 0:
+            for index in indices:
+                if index.id == 0 and not not_index:
+                    # the tile is forced to be empty
+                    index_rule.skip_full = True
+                elif (index.id > 0 and not not_index) or (index.id == 0 and not_index):
+                    # the tile is forced to be full
+                    index_rule.skip_empty = True
+                else:
+                    index_rule.skip_empty = False
+                    index_rule.skip_full = False
+
+    @staticmethod
+    def _add_default_rule(index_rule: IndexRule):
+        # without a rule for the tile itself only full tiles are changed
+        has_own_rule = any(rule.x == 0 and rule.y == 0 for rule in index_rule.rules)
+        if not has_own_rule and index_rule.default_rule:
+            index_rule.rules.append(PosRule(0, 0, True, [IndexInfo(0)]))
+            index_rule.skip_empty = True
+            index_rule.skip_full = False
+
+        if index_rule.skip_empty and index_rule.skip_full:
+            index_rule.skip_empty = False
+            index_rule.skip_full = False
+
+    def get_config(self, config: Union[int, str]):
+        if isinstance(config, int):
+            return self.configs[config]
+        for c in self.configs:
+            if c.name == config:
+                return c
+        raise RuntimeError(f'no automapper config named {config}')
+
+    def apply(self,
+              layer: 'Union[ItemTileLayer[VanillaTileManager], VanillaTileManager]',
+              config: Union[int, str] = 0,
+              seed: int = 0):
+        # unlike in the editor a seed of 0 is used as it is,
+        # the same seed always gives the same result
+        tiles = layer.tiles if isinstance(layer, ItemTileLayer) else layer
+        assert isinstance(tiles, VanillaTileManager)
+
+        array = tiles.array
+        ids = array['id'].astype(np.int16)
+        flags = array['flags'].copy()
+        for run_index, run in enumerate(self.get_config(config).runs):
+            if run.layer_copy:
+                self._apply_run(run, run_index, ids, flags, seed)
+            else:
+                self._apply_run_in_place(run, run_index, ids, flags, seed)
+
+        array['id'] = ids
+        array['flags'] = flags
+
+    @staticmethod
+    def _apply_run(run: AutomapperRun, run_index: int, ids: np.ndarray, flags: np.ndarray, seed: int):
+        # every rule is matched against a copy of the layer for all tiles at once,
+        # tiles outside of the layer have the index -1. Like in the editor only the
+        # pos rules read the copy, empty and full tiles are skipped by their current index
+        height, width = ids.shape
+        padding = max([max(abs(rule.x), abs(rule.y)) for index_rule in run.index_rules for rule in index_rule.rules], default=0)
+
+        read_ids = np.full((height + 2 * padding, width + 2 * padding), -1, dtype=np.int16)
+        read_ids[padding:padding + height, padding:padding + width] = ids
+        read_flags = np.zeros(read_ids.shape, dtype=np.uint8)
+        read_flags[padding:padding + height, padding:padding + width] = flags & _ORIENTATION_FLAGS
+
+        new_ids = ids.copy()
+        new_flags = flags.copy()
+        ys, xs = np.indices((height, width))
+        for rule_index, index_rule in enumerate(run.index_rules):
+            matches = np.ones((height, width), dtype=bool)
+            if index_rule.skip_empty:
+                matches &= new_ids != 0
+            if index_rule.skip_full:
+                matches &= new_ids == 0
+
+            for rule in index_rule.rules:
+                if not matches.any():
+                    break
+                rows = slice(padding + rule.y, padding + rule.y + height)
+                cols = slice(padding + rule.x, padding + rule.x + width)
+                window_ids, window_flags = read_ids[rows, cols], read_flags[rows, cols]
+
+                found = np.zeros((height, width), dtype=bool)
+                for index in rule.indices:
+                    index_matches = window_ids == index.id
+                    if index.test_flags:
+                        index_matches &= window_flags == index.flags
+                    found |= index_matches
+                matches &= ~found if rule.not_index else found
+
+            if index_rule.random_probability < 1.0:
+                hashes = _hash_location(seed, run_index, rule_index, xs, ys)
+                matches &= hashes < np.float32(HASH_MAX) * index_rule.random_probability
+
+            new_ids[matches] = index_rule.id
+            new_flags[matches] = index_rule.flags
+
+        ids[...] = new_ids
+        flags[...] = new_flags
+
+    @staticmethod
+    def _apply_run_in_place(run: AutomapperRun, run_index: int, ids: np.ndarray, flags: np.ndarray, seed: int):
+        # the rules see the changes of the tiles before, so the tiles are visited in order
+        height, width = ids.shape
+        tile_ids = ids.tolist()
+        tile_flags = flags.tolist()
+        probabilities = [rule.random_probability for rule in run.index_rules]
+        thresholds = [np.float32(HASH_MAX) * probability for probability in probabilities]
+        rule_hashes = [_hash_rule(seed, run_index, rule_index) for rule_index in range(len(run.index_rules))]
+        for y in range(height):
+            for x in range(width):
+                for rule_index, index_rule in enumerate(run.index_rules):
+                    if tile_ids[y][x] == 0:
+                        if index_rule.skip_empty:
+                            continue
+                    elif index_rule.skip_full:
+                        continue
+
+                    respects_rules = True
+                    for rule in index_rule.rules:
+                        check_x, check_y = x + rule.x, y + rule.y
+                        if 0 <= check_x < width and 0 <= check_y < height:
+                            check_id = tile_ids[check_y][check_x]
+                            check_flags = tile_flags[check_y][check_x] & _ORIENTATION_FLAGS
+                        else:
+                            check_id, check_flags = -1, 0
+
+                        found = any(check_id == index.id and (not index.test_flags or check_flags == index.flags) for index in rule.indices)
+                        if found == rule.not_index:
+                            respects_rules = False
+                            break
+
+                    if respects_rules and probabilities[rule_index] < 1.0:
+                        respects_rules = _hash_location_uint(rule_hashes[rule_index], x, y) < thresholds[rule_index]
+
+                    if respects_rules:
+                        tile_ids[y][x] = index_rule.id
+                        tile_flags[y][x] = index_rule.flags
+
+        ids[...] = tile_ids
+        flags[...] = tile_flags
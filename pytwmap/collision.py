@@ -0,0 +1,172 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from pytwmap.constants import CollisionFlag, GameTileType
+from pytwmap.twmap import TWMap
+
+
+TILE_SIZE = 32
+
+
+class RayHits(NamedTuple):
+    hit: np.ndarray
+    x: np.ndarray  # position of the collision, the end of the line without one
+    y: np.ndarray
+    before_x: np.ndarray  # last position before the collision
+    before_y: np.ndarray
+    flags: np.ndarray  # collision flags of the hit tile
+
+
+class CollisionMap:
+    """
+    Collision flags of the game and front layer packed into one byte per tile.
+
+    Positions are world positions like in the game, a tile is TILE_SIZE units wide
+    and positions outside of the map use the closest tile of the border.
+    All queries take scalars or arrays of positions.
+    """
+
+    def __init__(self, twmap: TWMap):
+        game = twmap.game_layer.tiles.read_array()['id']
+        flags = np.zeros(game.shape, dtype=np.uint8)
+        flags[game == GameTileType.SOLID] = CollisionFlag.SOLID
+        flags[game == GameTileType.DEATH] = CollisionFlag.DEATH
+        flags[game == GameTileType.NOHOOK] = CollisionFlag.SOLID | CollisionFlag.NOHOOK
+        flags[game == GameTileType.NOLASER] = CollisionFlag.NOLASER
+
+        if twmap.front_layer is not None:
+            front = twmap.front_layer.tiles.read_array()['id']
+            assert front.shape == game.shape
+            flags[front == GameTileType.DEATH] |= np.uint8(CollisionFlag.DEATH)
+            flags[front == GameTileType.NOLASER] |= np.uint8(CollisionFlag.NOLASER)
+
+        flags.flags.writeable = False
+        self.flags = flags
+        self.height, self.width = flags.shape
+
+        # summed-area tables of the tiles having one of the flags of a mask
+        self._sums: dict[int, np.ndarray] = {}
+
+    def _tile_coords(self, x: np.ndarray, y: np.ndarray):
+        # rounds to the closest unit first like the game does
+        x = (x + np.copysign(0.5, x)).astype(np.int64)
+        y = (y + np.copysign(0.5, y)).astype(np.int64)
+        return (
+            np.clip(x // TILE_SIZE, 0, self.width - 1),
+            np.clip(y // TILE_SIZE, 0, self.height - 1)
+        )
+
+    def get_flags(self, x: 'np.ndarray | float', y: 'np.ndarray | float'):
+        tile_x, tile_y = self._tile_coords(np.asarray(x), np.asarray(y))
+        return self.flags[tile_y, tile_x]
+
+    def check_point(self, x: 'np.ndarray | float', y: 'np.ndarray | float', mask: int = CollisionFlag.SOLID):
+        return self.get_flags(x, y) & mask != 0
+
+    def _summed_area(self, mask: int):
+        if mask not in self._sums:
+            table = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+            np.cumsum(np.cumsum(self.flags & mask != 0, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+            self._sums[mask] = table
+        return self._sums[mask]
+
+    def count_rect(self,
+                   x: 'np.ndarray | float',
+                   y: 'np.ndarray | float',
+                   width: 'np.ndarray | float',
+                   height: 'np.ndarray | float',
+                   mask: int = CollisionFlag.SOLID):
+        # number of tiles with one of the flags overlapping the rects
+        x, y = np.asarray(x), np.asarray(y)
+        x_begin = np.clip(np.floor(x / TILE_SIZE).astype(np.int64), 0, self.width - 1)
+        y_begin = np.clip(np.floor(y / TILE_SIZE).astype(np.int64), 0, self.height - 1)
+        x_end = np.clip(np.ceil((x + width) / TILE_SIZE).astype(np.int64), x_begin + 1, self.width)
+        y_end = np.clip(np.ceil((y + height) / TILE_SIZE).astype(np.int64), y_begin + 1, self.height)
+
+        table = self._summed_area(mask)
+        return table[y_end, x_end] - table[y_begin, x_end] - table[y_end, x_begin] + table[y_begin, x_begin]
+
+    def check_rect(self,
+                   x: 'np.ndarray | float',
+                   y: 'np.ndarray | float',
+                   width: 'np.ndarray | float',
+                   height: 'np.ndarray | float',
+                   mask: int = CollisionFlag.SOLID):
+        return self.count_rect(x, y, width, height, mask) > 0
+
+    def intersect_lines(self,
+                        x0: 'np.ndarray | float',
+                        y0: 'np.ndarray | float',
+                        x1: 'np.ndarray | float',
+                        y1: 'np.ndarray | float',
+                        mask: int = CollisionFlag.SOLID,
+                        chunk_size: int = 64):
+        """
+        Casts rays like IntersectLine of the game, e.g. for hooks with SOLID
+        or lasers with SOLID | NOLASER.
+
+        The lines are sampled once per unit of their length, chunk_size samples
+        of all pending lines are tested at once. Pieces of lines that only
+        cross tiles without the flags are skipped using the summed-area table.
+        """
+        x0, y0, x1, y1 = np.broadcast_arrays(*[np.asarray(v, dtype=np.float32) for v in [x0, y0, x1, y1]])
+        shape = x0.shape
+        x0, y0, x1, y1 = [v.ravel() for v in [x0, y0, x1, y1]]
+        dx, dy = x1 - x0, y1 - y0
+        ends = np.sqrt(dx * dx + dy * dy).astype(np.int64) + 1
+        inverse_ends = np.float32(1) / ends.astype(np.float32)
+
+        hit = np.zeros(len(x0), dtype=bool)
+        hit_x, hit_y = x1.copy(), y1.copy()
+        before_x, before_y = x1.copy(), y1.copy()
+        hit_flags = np.zeros(len(x0), dtype=np.uint8)
+
+        pending = np.arange(len(x0))
+        steps = np.arange(chunk_size, dtype=np.int64)
+        begin = 0
+        while len(pending):
+            pending = pending[ends[pending] >= begin]
+            if not len(pending):
+                break
+
+            # bounding boxes of the pieces, widened by the rounding of the positions
+            piece_begin = np.float32(begin) * inverse_ends[pending]
+            piece_end = np.minimum(begin + chunk_size - 1, ends[pending]).astype(np.float32) * inverse_ends[pending]
+            xs = [x0[pending] + dx[pending] * piece_begin, x0[pending] + dx[pending] * piece_end]
+            ys = [y0[pending] + dy[pending] * piece_begin, y0[pending] + dy[pending] * piece_end]
+            left, top = np.minimum(*xs) - 1, np.minimum(*ys) - 1
+            candidates = self.check_rect(left, top, np.maximum(*xs) + 1 - left, np.maximum(*ys) + 1 - top, mask)
+
+            tested = pending[candidates]
+            i = begin + steps[np.newaxis, :]
+            amounts = i.astype(np.float32) * inverse_ends[tested, np.newaxis]
+            px = x0[tested, np.newaxis] + dx[tested, np.newaxis] * amounts
+            py = y0[tested, np.newaxis] + dy[tested, np.newaxis] * amounts
+            flags = self.get_flags(px, py)
+            hits = (flags & mask != 0) & (i <= ends[tested, np.newaxis])
+
+            found = hits.any(axis=1)
+            rays = tested[found]
+            first = hits[found].argmax(axis=1)
+            rows = np.flatnonzero(found)
+            hit[rays] = True
+            hit_x[rays], hit_y[rays] = px[rows, first], py[rows, first]
+            hit_flags[rays] = flags[rows, first]
+
+            # the position of the step before, the start for hits in the first step
+            last = np.maximum(begin + first - 1, 0).astype(np.float32) * inverse_ends[rays]
+            before_x[rays] = x0[rays] + dx[rays] * last
+            before_y[rays] = y0[rays] + dy[rays] * last
+
+            pending = np.setdiff1d(pending, rays, assume_unique=True)
+            begin += chunk_size
+
+        return RayHits(
+            hit.reshape(shape),
+            hit_x.reshape(shape),
+            hit_y.reshape(shape),
+            before_x.reshape(shape),
+            before_y.reshape(shape),
+            hit_flags.reshape(shape)
+        )
@@ -46,6 +46,13 @@ class TileFlag(IntEnum):
     ROTATE = 8
 
 
+class CollisionFlag(IntEnum):
+    SOLID = 1
+    DEATH = 2
+    NOHOOK = 4
+    NOLASER = 8
+
+
 class CurveType(IntEnum):
     STEP = 0
     LINEAR = 1
@@ -120,3 +127,15 @@ class GameTileType:
 
     TILE_ENTITIES_OFF_1 = 190
     TILE_ENTITIES_OFF_2 = 191
+
+
+class TeleTileType:
+    TELEINEVIL = 10
+    TELEINWEAPON = 14
+    TELEINHOOK = 15
+    TELEIN = 26
+    TELEOUT = 27
+    TELECHECK = 29
+    TELECHECKOUT = 30
+    TELECHECKIN = 31
+    TELECHECKINEVIL = 63
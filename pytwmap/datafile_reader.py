@@ -1,22 +1,105 @@
+import io
+import itertools
+import mmap
+import os
+import struct
+import weakref
 import zlib
-from PIL import Image
-from typing import Optional, Type, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional, Type, TypeVar, Union
 
 from pytwmap.stringfile import StringFile
 from pytwmap.structs import c_int32
-from pytwmap.map_structs import CItemEnvelope, CItemGroup, CItemLayer, CItemQuadLayer, CItemSound, CItemSoundLayer, CItemTileLayer, CQuad, CVersionHeader, CHeader, CItemType, CItemVersion, CItemHeader, CItemInfo, CItemImage, c_struct
-from pytwmap.items import ItemEnvelope, ItemGroup, ItemImage, ItemImageExternal, ItemImageInternal, ItemLayer, ItemQuad, ItemQuadLayer, ItemVersion, ItemInfo, ItemTileLayer
+from pytwmap.map_structs import CItemEnvelope, CItemGroup, CItemLayer, CItemQuadLayer, CItemSound, CItemSoundLayer, CItemTileLayer, CVersionHeader, CHeader, CItemType, CItemVersion, CItemHeader, CItemInfo, CItemImage, c_struct
+from pytwmap.metadata import DataBlockMetadata, GroupMetadata, ImageMetadata, LayerMetadata, MapMetadata
+from pytwmap.items import ItemEnvelope, ItemGroup, ItemImage, ItemImageExternal, ItemImageInternal, ItemLayer, ItemQuadLayer, ItemRaw, ItemSound, ItemSoundLayer, QuadBuffer, ItemVersion, ItemInfo, ItemTileLayer
 from pytwmap.constants import ItemType, LayerFlags, LayerType, TileLayerFlags
-from pytwmap.tilemanager import SpeedupTileManager, SwitchTileManager, TeleTileManager, TuneTileManager, VanillaTileManager
+from pytwmap.tilemanager import TileManager, SpeedupTileManager, SwitchTileManager, TeleTileManager, TuneTileManager, VanillaTileManager
 
 
 T = TypeVar('T', bound=c_struct)
 
+TFile = Union[str, 'os.PathLike[str]', BinaryIO, bytes, bytearray, memoryview]
+
+# blocks of different readers are never equal, even if a reader is freed and its id reused
+_reader_serials = itertools.count()
+
+
+class DataBlock:
+    def __init__(self, reader: 'DataFileReader', index: int):
+        self._reader: 'Optional[DataFileReader]' = reader
+        self._source = reader._serial
+        self._index = index
+        self._size = reader._data_sizes[index]
+
+        # the compressed data is copied when the reader is closed
+        self._compressed: Optional[bytes] = None
+
+    def __eq__(self, other: object):
+        if not isinstance(other, DataBlock):
+            return NotImplemented
+        return self._source == other._source and self._index == other._index
+
+    def __hash__(self):
+        return hash((self._source, self._index))
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def compressed(self) -> bytes:
+        return bytes(self._compressed_view())
+
+    def _compressed_view(self):
+        # slice of the mapped file while it is open, it must not outlive the reader
+        if self._reader is None:
+            assert self._compressed is not None
+            return self._compressed
+        return self._reader._get_compressed(self._index)
+
+    def decompress(self):
+        if self._reader is None:
+            return zlib.decompress(self._compressed_view())
+        return self._reader._get_data(self._index)
+
+    def _detach(self):
+        assert self._reader is not None
+        self._compressed = bytes(self._reader._get_compressed(self._index))
+        self._reader = None
+
 
 # TODO: rename with c_item
 class DataFileReader:
-    def __init__(self, file_data: bytes):
-        self._data = StringFile(file_data)
+    def __init__(self, file: TFile, lazy: bool = False, workers: int = 1, sparse: bool = False, index: bool = False):
+        # tile data is only decompressed on first access if lazy is set,
+        # the file then has to stay open as long as the layers are used
+        self._lazy = lazy
+
+        # the ddnet gameplay layers are mostly empty, they are stored in chunks if sparse is set
+        self._sparse = sparse
+
+        # the positions of the gameplay tiles are indexed while loading if index is set
+        self._index = index
+
+        # with more than one worker all image and layer data blocks are
+        # decompressed concurrently before the images and groups are read
+        self._workers = workers
+        self._data_cache: 'dict[int, bytes]' = {}
+
+        # blocks still referenced by items, they are detached when the file is closed
+        self._serial = next(_reader_serials)
+        self._blocks: 'weakref.WeakValueDictionary[int, DataBlock]' = weakref.WeakValueDictionary()
+        self._closed = False
+
+        # the file is memory-mapped, all reads are zero-copy slices of it
+        self._mmap: Optional[mmap.mmap] = None
+        self._view = self._open_view(file)
+        self._data = StringFile(self._view)
 
         # init special layer references
         self.game_layer: 'Optional[ItemTileLayer[VanillaTileManager]]' = None
@@ -29,6 +112,8 @@ class DataFileReader:
         # item caches
         self._image_cache: 'dict[int, ItemImage]' = {}
         self._layer_cache: 'dict[int, ItemLayer]' = {}
+        self._envelopes: 'Optional[list[ItemEnvelope]]' = None
+        self._sounds: 'Optional[list[ItemSound]]' = None
 
         # read header of datafile
         self._ver_header = CVersionHeader.from_data(self._data)
@@ -39,31 +124,131 @@ class DataFileReader:
 
         self._header = CHeader.from_data(self._data)
 
-        self._item_types = [CItemType.from_data(self._data) for _ in range(self._header.num_item_types)]
+        self._item_types = CItemType.from_data_list(self._data, self._header.num_item_types)
 
-        self._item_offsets = [c_int32.from_data(self._data) for _ in range(self._header.num_items)]
-        self._data_offsets = [c_int32.from_data(self._data) for _ in range(self._header.num_data)]
-        self._data_sizes = [c_int32.from_data(self._data) for _ in range(self._header.num_data)]
+        self._item_offsets = c_int32.from_data_list(self._data, self._header.num_items)
+        self._data_offsets = c_int32.from_data_list(self._data, self._header.num_data)
+        self._data_sizes = c_int32.from_data_list(self._data, self._header.num_data)
 
         self._items_start = self._data.tell()
 
         self._calc_data_start()
 
+    def _open_view(self, file: TFile):
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            return memoryview(file)
+
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._mmap)
+
+        try:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self._mmap)
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            # file objects without a file descriptor (e.g. BytesIO)
+            return memoryview(file.read())
+
+    def close(self):
+        if self._closed:
+            return
+
+        # blocks that are still used keep a copy of their compressed data
+        for block in list(self._blocks.values()):
+            block._detach()
+        self._blocks.clear()
+        self._data_cache.clear()
+        self.clear_items()
+
+        self._closed = True
+        self._data = StringFile(b'')
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # views of the data that are still used keep the mapping open until they are freed
+                pass
+            self._mmap = None
+
+    def clear_items(self):
+        """Drops the cached items, they reference the reader through their data blocks."""
+        self.game_layer = None
+        self.tele_layer = None
+        self.speedup_layer = None
+        self.front_layer = None
+        self.switch_layer = None
+        self.tune_layer = None
+        self._image_cache = {}
+        self._layer_cache = {}
+        self._envelopes = None
+        self._sounds = None
+
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError('the file is closed')
+
+    def _get_block(self, data_ptr: int):
+        # equal blocks share one object, so closing the file copies each block once
+        block = self._blocks.get(data_ptr)
+        if block is None:
+            block = DataBlock(self, data_ptr)
+            self._blocks[data_ptr] = block
+        return block
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: object):
+        self.close()
+
     def _calc_data_start(self):
         self._data_start = self._header.num_item_types * CItemType.size_bytes()
         self._data_start += (self._header.num_items + 2 * self._header.num_data) * c_int32.size_bytes()
         self._data_start += self._header.item_size
         self._data_start += CVersionHeader.size_bytes() + CHeader.size_bytes()
 
-    def _get_data(self, data_ptr: int):
-        offset_begin = self._data_offsets[data_ptr]
-        offset_end = self._header.size
+    def _get_compressed_size(self, data_ptr: int):
+        offset_end = self._header.data_size
         if data_ptr + 1 < len(self._data_offsets):
             offset_end = self._data_offsets[data_ptr + 1]
-        num_bytes = offset_end - offset_begin
+        return offset_end - self._data_offsets[data_ptr]
 
-        self._data.seek(self._data_start + offset_begin)
-        return zlib.decompress(self._data.read(num_bytes))
+    def _get_compressed(self, data_ptr: int):
+        self._check_open()
+        self._data.seek(self._data_start + self._data_offsets[data_ptr])
+        return self._data.read(self._get_compressed_size(data_ptr))
+
+    def _get_data(self, data_ptr: int):
+        if data_ptr in self._data_cache:
+            return self._data_cache.pop(data_ptr)
+        return zlib.decompress(self._get_compressed(data_ptr))
+
+    def _get_referenced_data_ptrs(self):
+        data_ptrs: list[int] = []
+        for i in range(self._get_num_items(CItemLayer)):
+            layer = self._scan_layer(i)
+            if layer.type in [LayerType.SOUNDS, LayerType.SOUNDS_DEPCRECATED]:
+                continue  # sound sources are never decompressed
+            data_ptr = layer.data_ptr
+            if data_ptr >= 0:
+                data_ptrs.append(data_ptr)
+        return data_ptrs
+
+    def _get_image_data_ptrs(self):
+        data_ptrs: list[int] = []
+        for i in range(self._get_num_items(CItemImage)):
+            item = self._get_item(CItemImage, i)
+            if not item.external:
+                data_ptrs.append(item.data_ptr)
+        return data_ptrs
+
+    def _preload_data(self, data_ptrs: 'list[int]'):
+        # slicing is not thread safe, zlib releases the GIL while decompressing
+        compressed = [self._get_compressed(data_ptr) for data_ptr in data_ptrs]
+        with ThreadPoolExecutor(self._workers) as executor:
+            self._data_cache = dict(zip(data_ptrs, executor.map(zlib.decompress, compressed)))
 
     def _get_data_str(self, data_ptr: int):
         if data_ptr < 0:
@@ -120,6 +305,7 @@ class DataFileReader:
             raise RuntimeError('size of item_data is not as expected')
 
     def _get_item(self, item_type: Type[T], index: int) -> T:
+        self._check_open()
         start = self._get_type_start(item_type)
         if start is None:
             raise RuntimeError('item should not have been requested')
@@ -132,6 +318,61 @@ class DataFileReader:
 
         return item_type.from_data(self._data)
 
+    # types of the items that are parsed, all others are read as raw items
+    _parsed_types = [ItemType.VERSION, ItemType.INFO, ItemType.IMAGE, ItemType.GROUP, ItemType.LAYER]
+
+    # int32 fields of raw items that are data pointers
+    _raw_data_ptrs: 'dict[int, list[int]]' = {
+        ItemType.SOUND: [2, 3]  # sound_name, sound_data
+    }
+
+    def _get_raw_items_of_type(self, type_id: int):
+        for c_item in self._item_types:
+            if c_item.type_id == type_id:
+                return [self._get_raw_item(c_item.start + k) for k in range(c_item.num)]
+        return []
+
+    def _get_raw_item(self, item_index: int):
+        self._check_open()
+        self._data.seek(self._items_start + self._item_offsets[item_index])
+        header = CItemHeader.from_data(self._data)
+        type_id = (header.type_id_index >> 16) & 0xffff
+        data = bytes(self._data.read(header.size))
+
+        data_blocks: dict[int, DataBlock] = {}
+        for field in self._raw_data_ptrs.get(type_id, []):
+            if 4 * field + 4 > len(data):
+                continue
+            data_ptr, = struct.unpack_from('<i', data, 4 * field)
+            if data_ptr >= 0:
+                data_blocks[field] = self._get_block(data_ptr)
+
+        return ItemRaw(
+            type_id=type_id,
+            data=data,
+            id=header.type_id_index & 0xffff,
+            data_blocks=data_blocks
+        )
+
+    def get_envelopes(self):
+        if self._envelopes is None:
+            self._envelopes = [ItemEnvelope(item.data) for item in self._get_raw_items_of_type(ItemType.ENVELOPE)]
+        return self._envelopes
+
+    def get_sounds(self):
+        if self._sounds is None:
+            self._sounds = [ItemSound(item.data, item.data_blocks) for item in self._get_raw_items_of_type(ItemType.SOUND)]
+        return self._sounds
+
+    def get_raw_items(self):
+        """Returns all items that are neither parsed nor envelopes or sounds."""
+        raw_items: list[ItemRaw] = []
+        for c_item in self._item_types:
+            if c_item.type_id in self._parsed_types + [ItemType.ENVELOPE, ItemType.SOUND]:
+                continue
+            raw_items += self._get_raw_items_of_type(c_item.type_id)
+        return raw_items
+
     def get_version(self):
         item = self._get_item(CItemVersion, 0)
 
@@ -152,7 +393,7 @@ class DataFileReader:
         license = self._get_data_str(item.license_ptr)
         settings: list[str] = self._get_data_str_list(item.settings_ptr)
 
-        return ItemInfo(
+        info = ItemInfo(
             author=author,
             mapversion=mapversion,
             credits=credits,
@@ -160,6 +401,17 @@ class DataFileReader:
             settings=settings
         )
 
+        # keep the blocks to reuse them if the values are unchanged
+        for field, data_ptr in [('author', item.author_ptr),
+                                ('mapversion', item.map_version_ptr),
+                                ('credits', item.credits_ptr),
+                                ('license', item.license_ptr),
+                                ('settings', item.settings_ptr)]:
+            if data_ptr >= 0:
+                info._set_source_block(field, self._get_block(data_ptr))
+
+        return info
+
     def _get_image(self, index: int):
         # check for optional pointers
         if index < 0:
@@ -178,18 +430,63 @@ class DataFileReader:
         if item.external:
             img_item = ItemImageExternal(name=name)
         else:
-            loaded_img: Image.Image = Image.frombytes(  # type: ignore
-                'RGBA',
-                (item.width, item.height),
-                self._get_data(item.data_ptr)
+            img_item = ItemImageInternal._from_block(
+                self._get_block(item.data_ptr),
+                item.width,
+                item.height,
+                name=name,
+                pixels=self._data_cache.pop(item.data_ptr, None)
             )
-            img_item = ItemImageInternal(image=loaded_img, name=name)
 
         self._image_cache[index] = img_item
         return img_item
 
+    def get_images(self):
+        # with more than one worker the images are decoded concurrently,
+        # otherwise they are decoded on first access
+        if self._workers > 1 and not self._lazy:
+            self._preload_data(self._get_image_data_ptrs())
+        images = [self._get_image(i) for i in range(self._get_num_items(CItemImage))]
+        self._data_cache.clear()
+        return images
+
     def _get_envelope(self, index: int):
-        pass
+        # check for optional pointers
+        if index < 0:
+            return None
+        return self.get_envelopes()[index]
+
+    def _get_sound(self, index: int):
+        # check for optional pointers
+        if index < 0:
+            return None
+        return self.get_sounds()[index]
+
+    _manager_types: 'dict[LayerType, Type[TileManager]]' = {
+        LayerType.TELE: TeleTileManager,
+        LayerType.SPEEDUP: SpeedupTileManager,
+        LayerType.SWITCH: SwitchTileManager,
+        LayerType.TUNE: TuneTileManager
+    }
+
+    _sparse_types = [LayerType.TELE, LayerType.SPEEDUP, LayerType.FRONT, LayerType.SWITCH, LayerType.TUNE]
+
+    @staticmethod
+    def _get_tile_layer_type(item: CItemTileLayer):
+        flags = item.flags
+        if TileLayerFlags.GAME & flags:
+            return LayerType.GAME, item.data_ptr
+        elif TileLayerFlags.TELE & flags:
+            return LayerType.TELE, item.data_tele_ptr
+        elif TileLayerFlags.SPEEDUP & flags:
+            return LayerType.SPEEDUP, item.data_speedup_ptr
+        elif TileLayerFlags.FRONT & flags:
+            return LayerType.FRONT, item.data_front_ptr
+        elif TileLayerFlags.SWITCH & flags:
+            return LayerType.SWITCH, item.data_switch_ptr
+        elif TileLayerFlags.TUNE & flags:
+            return LayerType.TUNE, item.data_tune_ptr
+        return LayerType.TILES, item.data_ptr
 
     def _add_tile_layer(self, index: int, detail: bool):
         item = self._get_item(CItemTileLayer, index)
@@ -197,42 +494,33 @@ class DataFileReader:
         if item.version != 3:
             raise RuntimeError('unexpected tilelayer version')
 
-        # read flags
-        flags = item.flags
-        is_game = TileLayerFlags.GAME & flags > 0
-        is_tele = TileLayerFlags.TELE & flags > 0
-        is_speedup = TileLayerFlags.SPEEDUP & flags > 0
-        is_front = TileLayerFlags.FRONT & flags > 0
-        is_switch = TileLayerFlags.SWITCH & flags > 0
-        is_tune = TileLayerFlags.TUNE & flags > 0
-
-        # set managertype and data_ptr
-        manager_type = VanillaTileManager
-        data_ptr = item.data_ptr
-        if is_tele:
-            manager_type = TeleTileManager
-            data_ptr = item.data_tele_ptr
-        elif is_speedup:
-            manager_type = SpeedupTileManager
-            data_ptr = item.data_speedup_ptr
-        elif is_front:
-            data_ptr = item.data_front_ptr
-        elif is_switch:
-            manager_type = SwitchTileManager
-            data_ptr = item.data_switch_ptr
-        elif is_tune:
-            manager_type = TuneTileManager
-            data_ptr = item.data_tune_ptr
+        layer_type, data_ptr = self._get_tile_layer_type(item)
+        manager_type = self._manager_types.get(layer_type, VanillaTileManager)
 
         # find references
         env_ref: Optional[ItemEnvelope] = self._get_envelope(item.color_envelope_ref)
         image_ref: Optional[ItemImage] = self._get_image(item.image_ref)
 
-        tile_manager = manager_type(
-            item.width,
-            item.height,
-            data=self._get_data(data_ptr)
-        )
+        sparse = self._sparse and layer_type in self._sparse_types
+
+        if self._lazy:
+            tile_manager = manager_type(
+                item.width,
+                item.height,
+                block=self._get_block(data_ptr),
+                sparse=sparse
+            )
+        else:
+            tile_manager = manager_type(
+                item.width,
+                item.height,
+                data=self._get_data(data_ptr),
+                block=self._get_block(data_ptr),
+                sparse=sparse
+            )
+
+        if self._index and layer_type != LayerType.TILES:
+            tile_manager.build_index()
 
         layer_item = ItemTileLayer(
             tiles=tile_manager,
@@ -244,44 +532,22 @@ class DataFileReader:
             name=item.name
         )
 
-        if is_game:
+        if layer_type == LayerType.GAME:
             self.game_layer = layer_item  # type: ignore
-        elif is_tele:
+        elif layer_type == LayerType.TELE:
             self.tele_layer = layer_item  # type: ignore
-        elif is_speedup:
+        elif layer_type == LayerType.SPEEDUP:
             self.speedup_layer = layer_item  # type: ignore
-        elif is_front:
+        elif layer_type == LayerType.FRONT:
             self.front_layer = layer_item  # type: ignore
-        elif is_switch:
+        elif layer_type == LayerType.SWITCH:
             self.switch_layer = layer_item  # type: ignore
-        elif is_tune:
+        elif layer_type == LayerType.TUNE:
             self.tune_layer = layer_item  # type: ignore
 
         self._layer_cache[index] = layer_item
         return layer_item
 
-    def cquad_to_item(self, c_quad: CQuad):
-        map_coordinates = tuple([x.as_tuple() for x in c_quad.positions])
-        corner_colors = tuple([x.as_tuple() for x in c_quad.colors])
-        texture_coordinates = tuple([x.as_tuple() for x in c_quad.texture_coordinates])
-        assert len(map_coordinates) == 5
-        assert len(corner_colors) == 4
-        assert len(texture_coordinates) == 4
-
-        pos_env_ref: Optional[ItemEnvelope] = self._get_envelope(c_quad.position_envelope_ref)
-        col_env_ref: Optional[ItemEnvelope] = self._get_envelope(c_quad.color_envelope_ref)
-
-        return ItemQuad(
-            corners=map_coordinates[:-1],
-            pivot=map_coordinates[-1],
-            corner_colors=corner_colors,
-            texture_coordinates=texture_coordinates,
-            position_envelope_ref=pos_env_ref,
-            position_envelope_offset=c_quad.position_envelope_offset,
-            color_envelope_ref=col_env_ref,
-            color_envelope_offset=c_quad.color_envelope_offset
-        )
-
     def _add_quad_layer(self, index: int, detail: bool):
         item = self._get_item(CItemQuadLayer, index)
 
@@ -290,13 +556,8 @@ class DataFileReader:
 
         image_ref: Optional[ItemImage] = self._get_image(item.image_ref)
 
-        # read quads
-        quad_data = self._get_data(item.data_ptr)
-        quad_reader = StringFile(quad_data)
-        c_quads = [CQuad.from_data(quad_reader) for _ in range(item.num_quads)]
-
         layer_item = ItemQuadLayer(
-            quads=[self.cquad_to_item(x) for x in c_quads],
+            quads=QuadBuffer.from_bytes(self._get_data(item.data_ptr), item.num_quads, self.get_envelopes()),
             image_ref=image_ref,
             detail=detail,
             name=item.name
@@ -305,10 +566,23 @@ class DataFileReader:
         self._layer_cache[index] = layer_item
         return layer_item
 
-    def _add_sound_layer(self, index: int, detail: bool):
-        # if item_data.version.value != 3:
-        #     raise RuntimeError('unexpected tilelayer version')
-        pass
+    def _add_sound_layer(self, index: int, layer_type: LayerType, detail: bool):
+        item = self._get_item(CItemSoundLayer, index)
+
+        if item.version not in [1, 2]:
+            raise RuntimeError('unexpected soundlayer version')
+
+        layer_item = ItemSoundLayer(
+            sources=self._get_block(item.data_ptr) if item.data_ptr >= 0 else b'',
+            num_sources=item.num_sources,
+            sound_ref=self._get_sound(item.sound_ref),
+            layer_type=layer_type,
+            detail=detail,
+            name=item.name
+        )
+
+        self._layer_cache[index] = layer_item
+        return layer_item
 
     def _get_layer(self, index: int):
         # check for optional pointers
@@ -323,7 +597,7 @@ class DataFileReader:
         detail = LayerFlags.DETAIL & item.flags > 0
 
         if item.type in [LayerType.SOUNDS, LayerType.SOUNDS_DEPCRECATED]:
-            return self._add_sound_layer(index, detail)
+            return self._add_sound_layer(index, LayerType(item.type), detail)
         elif item.type == LayerType.QUADS:
             return self._add_quad_layer(index, detail)
         else:
@@ -339,15 +613,9 @@ class DataFileReader:
             layer_refs: list[ItemLayer] = []
             for k in range(item.num_layers):
                 ref = self._get_layer(item.start_layer + k)
-
-                # TODO: this check is not needed if all layers are implemented
-                if ref:
-                    layer_refs.append(ref)
-                # TODO: enable when all layers have been implemented
-                # else:
-                #     raise RuntimeError('')
-            if len(layer_refs) == 0:
-                continue  # TODO: remove when all layers have been implemented
+                if ref is None:
+                    raise RuntimeError('group references an invalid layer')
+                layer_refs.append(ref)
 
             yield ItemGroup(
                 layers=layer_refs,
@@ -364,4 +632,84 @@ class DataFileReader:
             )
 
     def get_groups(self):
-        return list(self._get_groups_generator())
+        if self._workers > 1 and not self._lazy:
+            self._preload_data(self._get_referenced_data_ptrs())
+        groups = list(self._get_groups_generator())
+        self._data_cache.clear()
+        return groups
+
+    def _scan_layer(self, index: int):
+        item = self._get_item(CItemLayer, index)
+        detail = LayerFlags.DETAIL & item.flags > 0
+
+        if item.type == LayerType.QUADS:
+            quad_item = self._get_item(CItemQuadLayer, index)
+            return LayerMetadata(
+                index=index,
+                type=LayerType.QUADS,
+                name=quad_item.name,
+                detail=detail,
+                num_quads=quad_item.num_quads,
+                image_ref=quad_item.image_ref,
+                data_ptr=quad_item.data_ptr
+            )
+        elif item.type == LayerType.TILES:
+            tile_item = self._get_item(CItemTileLayer, index)
+            layer_type, data_ptr = self._get_tile_layer_type(tile_item)
+            return LayerMetadata(
+                index=index,
+                type=layer_type,
+                name=tile_item.name,
+                detail=detail,
+                width=tile_item.width,
+                height=tile_item.height,
+                image_ref=tile_item.image_ref,
+                data_ptr=data_ptr
+            )
+        elif item.type in [LayerType.SOUNDS, LayerType.SOUNDS_DEPCRECATED]:
+            sound_item = self._get_item(CItemSoundLayer, index)
+            return LayerMetadata(
+                index=index,
+                type=LayerType(item.type),
+                name=sound_item.name,
+                detail=detail,
+                data_ptr=sound_item.data_ptr
+            )
+        return LayerMetadata(index=index, type=LayerType(item.type), detail=detail)
+
+    def _scan_image(self, index: int):
+        item = self._get_item(CItemImage, index)
+        return ImageMetadata(
+            index=index,
+            name=self._get_data_str(item.name_ptr),
+            width=item.width,
+            height=item.height,
+            external=item.external > 0,
+            data_ptr=item.data_ptr
+        )
+
+    def _scan_group(self, index: int):
+        item = self._get_item(CItemGroup, index)
+        return GroupMetadata(
+            index=index,
+            name=item.name,
+            layers=[self._scan_layer(item.start_layer + k) for k in range(item.num_layers)]
+        )
+
+    def scan(self):
+        """Reads the map metadata without decompressing tile or image data."""
+        data_blocks: list[DataBlockMetadata] = []
+        for i in range(len(self._data_offsets)):
+            data_blocks.append(DataBlockMetadata(
+                index=i,
+                compressed_size=self._get_compressed_size(i),
+                size=self._data_sizes[i]
+            ))
+
+        return MapMetadata(
+            item_types={c_item.type_id: c_item.num for c_item in self._item_types},
+            info=self.get_info(),
+            images=[self._scan_image(i) for i in range(self._get_num_items(CItemImage))],
+            groups=[self._scan_group(i) for i in range(self._get_num_items(CItemGroup))],
+            data_blocks=data_blocks
+        )
@@ -1,28 +1,65 @@
-from typing import Optional
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional, Union
+import hashlib
+import os
+import secrets
+import struct
 import zlib
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from pytwmap.constants import ItemType
-from pytwmap.map_structs import CHeader, CItemGroup, CItemHeader, CItemImage, CItemInfo, CItemLayer, CItemTileLayer, CItemType, CItemVersion, CVersionHeader
-from pytwmap.stringfile import StringFile
-from pytwmap.structs import c_int32_color, c_intstr3, c_rawstr4, c_int32, c_struct
-from pytwmap.items import ItemEnvelope, ItemGroup, ItemImage, ItemInfo, ItemLayer, ItemVersion, ItemQuadLayer, ItemSoundLayer, ItemTileLayer
+from pytwmap.datafile_reader import DataBlock
+from pytwmap.map_structs import CHeader, CItemGroup, CItemHeader, CItemImage, CItemInfo, CItemLayer, CItemQuadLayer, CItemSoundLayer, CItemTileLayer, CItemType, CItemVersion, CVersionHeader
+from pytwmap.structs import c_bytes, c_int32_color, c_intstr3, c_rawstr4, c_int32, c_type
+from pytwmap.items import ItemEnvelope, ItemGroup, ItemImage, ItemInfo, ItemLayer, ItemRaw, ItemSound, ItemVersion, ItemQuadLayer, ItemSoundLayer, ItemTileLayer
 from pytwmap.tilemanager import TileManager
 
 
-class DataFileWriter:
-    def __init__(self):
-        self._data_file = StringFile(b'')
+# zero filled blocks are compressed from this piece instead of being allocated
+_ZERO_PIECE = bytes(1 << 16)
+
+
+class ItemLayout(NamedTuple):
+    type_ids: 'list[int]'
+    type_starts: 'list[int]'
+    item_offsets: 'list[int]'
+    item_size: int
+
 
-        self._item_types: defaultdict[int, int] = defaultdict(int)
-        self._items: defaultdict[int, list[list[c_struct]]] = defaultdict(list)
+class DataFileWriter:
+    def __init__(self,
+                 level: int = zlib.Z_DEFAULT_COMPRESSION,
+                 strategy: int = zlib.Z_DEFAULT_STRATEGY,
+                 wbits: int = zlib.MAX_WBITS,
+                 workers: int = 1):
+        # data blocks are compressed when the file is written,
+        # concurrently if more than one worker is used
+        self._level = level
+        self._strategy = strategy
+        self._wbits = wbits
+        self._workers = workers
+        # unmodified data is copied from the compressed blocks it was loaded from,
+        # sparse tiles are only converted to the dense layout while they are compressed
+        # and zero filled blocks are only stored as their size
+        self._data_blocks: list[Union[bytes, DataBlock, TileManager, int]] = []
+
+        # identical data blocks are only stored once
+        self._data_refs: dict[tuple[int, bytes], int] = {}
+        self._zero_data_refs: dict[int, int] = {}
+        self._block_refs: dict[DataBlock, int] = {}
+        self._tiles_refs: dict[int, int] = {}
+
+        self._items: defaultdict[int, list[list[c_type]]] = defaultdict(list)
+        self._item_ids: dict[tuple[int, int], int] = {}
+        self._layout: Optional[ItemLayout] = None
 
         self._envelope_refs: dict[ItemEnvelope, int] = {}
+        self._sound_refs: dict[ItemSound, int] = {}
         self._image_refs: dict[ItemImage, int] = {}
 
-        self._data = StringFile(b'')
         self._data_offsets: list[int] = []
         self._data_sizes: list[int] = []
+        self._data_size = 0
 
     def set_special_layers(self,
                            game_layer: ItemLayer,
@@ -38,30 +75,32 @@ class DataFileWriter:
         self._switch_layer = switch_layer
         self._tune_layer = tune_layer
 
+    def _set_item(self, type_id: int, c_items: 'list[c_type]'):
+        self._items[type_id] = [c_items]
+        self._layout = None
+
+    def _add_item(self, type_id: int, c_items: 'list[c_type]', item_id: Optional[int] = None):
+        self._items[type_id].append(c_items)
+        self._layout = None
+
+        # items are identified by their index unless another id is given
+        index = len(self._items[type_id]) - 1
+        if item_id is not None:
+            self._item_ids[(type_id, index)] = item_id
+        return index
+
     def register_version(self, item: ItemVersion):
         c_item = CItemVersion()
         c_item.version = c_int32(item.version)
 
-        self._item_types[ItemType.VERSION] = 1
-        self._items[ItemType.VERSION] = [[c_item]]
+        self._set_item(ItemType.VERSION, [c_item])
 
     def register_info(self, item: ItemInfo):
-        author_ptr = -1
-        mapversion_ptr = -1
-        credits_ptr = -1
-        license_ptr = -1
-        settings_ptr = -1
-
-        if item.author:
-            author_ptr = self._register_data_str(item.author)
-        if item.mapversion:
-            mapversion_ptr = self._register_data_str(item.mapversion)
-        if item.credits:
-            credits_ptr = self._register_data_str(item.credits)
-        if item.license:
-            license_ptr = self._register_data_str(item.license)
-        if item.settings:
-            settings_ptr = self._register_data_str_list(item.settings)
+        author_ptr = self._register_info_str(item, 'author')
+        mapversion_ptr = self._register_info_str(item, 'mapversion')
+        credits_ptr = self._register_info_str(item, 'credits')
+        license_ptr = self._register_info_str(item, 'license')
+        settings_ptr = self._register_info_str(item, 'settings')
 
         c_item = CItemInfo()
         c_item.version = c_int32(1)
@@ -71,8 +110,23 @@ class DataFileWriter:
         c_item.license_ptr = c_int32(license_ptr)
         c_item.settings_ptr = c_int32(settings_ptr)
 
-        self._item_types[ItemType.INFO] = 1
-        self._items[ItemType.INFO] = [[c_item]]
+        self._set_item(ItemType.INFO, [c_item])
+
+    def _register_info_str(self, item: ItemInfo, field: str):
+        value = getattr(item, field)
+        if not value:
+            return -1
+
+        block = item.get_source_block(field)
+        if block is not None:
+            return self._register_block(block)
+
+        if isinstance(value, list):
+            return self._register_data_str_list(value)
+        return self._register_data_str(value)
+
+    def register_image(self, item: ItemImage):
+        self._register_image(item)
 
     def _register_image(self, item: Optional[ItemImage]):
         if item is None:
@@ -83,42 +137,71 @@ class DataFileWriter:
 
         name_ptr = self._register_data_str(item.name)
         data_ptr = -1
-        if not item.external:
-            data_ptr = self._register_data(item.image.tobytes())  # type: ignore
+        if item.source_block is not None:
+            data_ptr = self._register_block(item.source_block)
+        elif not item.external:
+            data_ptr = self._register_data(item.view().cast('B'))  # type: ignore
 
         c_item = CItemImage()
         c_item.version = c_int32(1)
-        c_item.width = c_int32(item.image.width)
-        c_item.height = c_int32(item.image.height)
+        c_item.width = c_int32(item.width)
+        c_item.height = c_int32(item.height)
         c_item.external = c_int32(item.external)
         c_item.name_ptr = c_int32(name_ptr)
         c_item.data_ptr = c_int32(data_ptr)
 
-        self._image_refs[item] = len(self._items[ItemType.IMAGE])
-        self._item_types[ItemType.IMAGE] += 1
-        self._items[ItemType.IMAGE].append([c_item])
+        self._image_refs[item] = self._add_item(ItemType.IMAGE, [c_item])
 
         return self._image_refs[item]
 
+    def _construct_raw_item(self, item: ItemRaw):
+        # data pointers are remapped, the blocks are copied without recompressing
+        data = bytearray(item.data)
+        for field, block in item.data_blocks.items():
+            struct.pack_into('<i', data, 4 * field, self._register_block(block))
+        return c_bytes(data)
+
+    def register_raw_item(self, item: ItemRaw):
+        self._add_item(item.type_id, [self._construct_raw_item(item)], item.id)
+
+    def register_envelope(self, item: ItemEnvelope):
+        self._register_envelope(item)
+
     def _register_envelope(self, item: Optional[ItemEnvelope]):
-        return -1
+        if item is None:
+            return -1
+
+        if item not in self._envelope_refs:
+            self._envelope_refs[item] = self._add_item(ItemType.ENVELOPE, [self._construct_raw_item(item)])
+
+        return self._envelope_refs[item]
+
+    def register_sound(self, item: ItemSound):
+        self._register_sound(item)
+
+    def _register_sound(self, item: Optional[ItemSound]):
+        if item is None:
+            return -1
+
+        if item not in self._sound_refs:
+            self._sound_refs[item] = self._add_item(ItemType.SOUND, [self._construct_raw_item(item)])
+
+        return self._sound_refs[item]
 
     def _register_layer(self, item: ItemLayer):
+        c_items: list[c_type]
         if isinstance(item, ItemTileLayer):
             c_items = self._construct_tile_layer(item)  # type: ignore
         elif isinstance(item, ItemQuadLayer):
-            raise NotImplementedError()
-            # c_items = self._construct_quad_layer(item)
+            c_items = self._construct_quad_layer(item)
         elif isinstance(item, ItemSoundLayer):
-            raise NotImplementedError()
-            # c_items = self._construct_sound_layer(item)
+            c_items = self._construct_sound_layer(item)
         else:
             raise RuntimeError("layer has invalid type")
 
-        self._item_types[ItemType.LAYER] += 1
-        self._items[ItemType.LAYER].append(c_items)
+        self._add_item(ItemType.LAYER, c_items)
 
-    def _construct_tile_layer(self, item: ItemTileLayer[TileManager]) -> 'list[c_struct]':
+    def _construct_tile_layer(self, item: ItemTileLayer[TileManager]) -> 'list[c_type]':
         c_item_header = CItemLayer()
         c_item_header.version = c_int32(-1)
         c_item_header.type = c_int32(2)
@@ -132,7 +215,12 @@ class DataFileWriter:
         c_item_body.color_envelope_offset = c_int32(item.color_envelope_offset)
 
         # TODO: is this actually correct to create a new layer for every ddnet layer?
-        stored_data_ptr = c_int32(self._register_data(item.tiles.raw_data))
+        if item.tiles.source_block is not None:
+            stored_data_ptr = c_int32(self._register_block(item.tiles.source_block))
+        elif item.tiles.sparse:
+            stored_data_ptr = c_int32(self._register_tiles(item.tiles))
+        else:
+            stored_data_ptr = c_int32(self._register_data(item.tiles.dense_data()))
 
         c_item_body.flags = c_int32(0)
         c_item_body.data_ptr = stored_data_ptr
@@ -146,23 +234,23 @@ class DataFileWriter:
         elif item == self._tele_layer:
             c_item_body.flags = c_int32(2)
             c_item_body.data_tele_ptr = stored_data_ptr
-            c_item_body.data_ptr = c_int32(self._register_data(bytes(item.width * item.height * 2)))
+            c_item_body.data_ptr = c_int32(self._register_zero_data(item.width * item.height * 4))
         elif item == self._speedup_layer:
             c_item_body.flags = c_int32(4)
             c_item_body.data_speedup_ptr = stored_data_ptr
-            c_item_body.data_ptr = c_int32(self._register_data(bytes(item.width * item.height * 6)))
+            c_item_body.data_ptr = c_int32(self._register_zero_data(item.width * item.height * 4))
         elif item == self._front_layer:
             c_item_body.flags = c_int32(8)
             c_item_body.data_front_ptr = stored_data_ptr
-            c_item_body.data_ptr = c_int32(self._register_data(bytes(item.width * item.height * 4)))
+            c_item_body.data_ptr = c_int32(self._register_zero_data(item.width * item.height * 4))
         elif item == self._switch_layer:
             c_item_body.flags = c_int32(16)
             c_item_body.data_switch_ptr = stored_data_ptr
-            c_item_body.data_ptr = c_int32(self._register_data(bytes(item.width * item.height * 4)))
+            c_item_body.data_ptr = c_int32(self._register_zero_data(item.width * item.height * 4))
         elif item == self._tune_layer:
             c_item_body.flags = c_int32(32)
             c_item_body.data_tune_ptr = stored_data_ptr
-            c_item_body.data_ptr = c_int32(self._register_data(bytes(item.width * item.height * 2)))
+            c_item_body.data_ptr = c_int32(self._register_zero_data(item.width * item.height * 4))
 
         c_item_body.color_envelope_ref = c_int32(self._register_envelope(item.color_envelope))
         c_item_body.image_ref = c_int32(self._register_image(item.image))
@@ -171,11 +259,44 @@ class DataFileWriter:
 
         return [c_item_header, c_item_body]
 
-    def _construct_quad_layer(self, item: ItemQuadLayer):
-        pass
+    def _construct_quad_layer(self, item: ItemQuadLayer) -> 'list[c_type]':
+        c_item_header = CItemLayer()
+        c_item_header.version = c_int32(-1)
+        c_item_header.type = c_int32(3)
+        c_item_header.flags = c_int32(item.detail)
 
-    def _construct_sound_layer(self, item: ItemSoundLayer):
-        pass
+        # the envelope refs of the quads are translated to the indices of the saved envelopes
+        for envelope in item.quads.envelopes:
+            self._register_envelope(envelope)
+
+        c_item_body = CItemQuadLayer()
+        c_item_body.version = c_int32(2)
+        c_item_body.num_quads = c_int32(len(item.quads))
+        c_item_body.data_ptr = c_int32(self._register_data(item.quads.tobytes(list(self._envelope_refs))))
+        c_item_body.image_ref = c_int32(self._register_image(item.image))
+        c_item_body.name = c_intstr3(item.name)
+
+        return [c_item_header, c_item_body]
+
+    def _construct_sound_layer(self, item: ItemSoundLayer) -> 'list[c_type]':
+        c_item_header = CItemLayer()
+        c_item_header.version = c_int32(-1)
+        c_item_header.type = c_int32(item.layer_type)
+        c_item_header.flags = c_int32(item.detail)
+
+        if isinstance(item.sources, DataBlock):
+            data_ptr = self._register_block(item.sources)
+        else:
+            data_ptr = self._register_data(item.sources)
+
+        c_item_body = CItemSoundLayer()
+        c_item_body.version = c_int32(2)
+        c_item_body.num_sources = c_int32(item.num_sources)
+        c_item_body.data_ptr = c_int32(data_ptr)
+        c_item_body.sound_ref = c_int32(self._register_sound(item.sound))
+        c_item_body.name = c_intstr3(item.name)
+
+        return [c_item_header, c_item_body]
 
     def register_group(self, item: ItemGroup):
         c_item = CItemGroup()
@@ -185,10 +306,6 @@ class DataFileWriter:
         c_item.x_parallax = c_int32(item.x_parallax)
         c_item.y_parallax = c_int32(item.y_parallax)
 
-        # TODO: how to handle this
-        if len(item.layers) == 0:
-            raise NotImplementedError('group without layers cannot be handled yet')
-
         c_item.start_layer = c_int32(len(self._items[ItemType.LAYER]))
         c_item.num_layers = c_int32(len(item.layers))
 
@@ -203,8 +320,7 @@ class DataFileWriter:
 
         c_item.name = c_intstr3(item.name)
 
-        self._item_types[ItemType.GROUP] += 1
-        self._items[ItemType.GROUP].append([c_item])
+        self._add_item(ItemType.GROUP, [c_item])
 
     def _register_data_str_list(self, data: 'list[str]'):
         byte_data = b''
@@ -216,111 +332,220 @@ class DataFileWriter:
         return self._register_data(data.encode('utf8') + b'\0')
 
     def _register_data(self, data: bytes):
-        self._data_offsets.append(len(self._data))
-        self._data_sizes.append(len(data))
-
-        compressed_data = zlib.compress(data)
-        self._data.append(compressed_data)
+        key = (len(data), hashlib.blake2b(data, digest_size=16).digest())
+        index = self._data_refs.get(key)
+        if index is not None and self._data_blocks[index] == data:
+            return index
 
-        return len(self._data_offsets) - 1
+        self._data_blocks.append(data)
+        self._data_sizes.append(len(data))
 
-    def _write_ver_header(self):
+        self._data_refs[key] = len(self._data_blocks) - 1
+        return len(self._data_blocks) - 1
+
+    def _register_block(self, block: DataBlock):
+        if block not in self._block_refs:
+            self._data_blocks.append(block)
+            self._data_sizes.append(block.size)
+            self._block_refs[block] = len(self._data_blocks) - 1
+        return self._block_refs[block]
+
+    def _register_tiles(self, tiles: TileManager):
+        # the tiles are not hashed, that would convert them before they are compressed
+        if id(tiles) not in self._tiles_refs:
+            self._data_blocks.append(tiles)
+            self._data_sizes.append(tiles.width * tiles.height * tiles._tile_bytes)
+            self._tiles_refs[id(tiles)] = len(self._data_blocks) - 1
+        return self._tiles_refs[id(tiles)]
+
+    def _register_zero_data(self, size: int):
+        # avoids allocating and hashing the zero filled buffers of ddnet layers
+        if size not in self._zero_data_refs:
+            self._data_blocks.append(size)
+            self._data_sizes.append(size)
+            self._zero_data_refs[size] = len(self._data_blocks) - 1
+        return self._zero_data_refs[size]
+
+    def _compress(self, data: Union[bytes, DataBlock, TileManager, int]):
+        if isinstance(data, DataBlock):
+            return data._compressed_view()
+        if isinstance(data, TileManager):
+            data = data.dense_data()
+
+        compressor = zlib.compressobj(self._level, zlib.DEFLATED, self._wbits, strategy=self._strategy)
+        if isinstance(data, int):
+            # zero filled blocks are compressed in pieces
+            compressed = [compressor.compress(_ZERO_PIECE[:min(len(_ZERO_PIECE), data - offset)])
+                          for offset in range(0, data, len(_ZERO_PIECE))]
+            return b''.join(compressed) + compressor.flush()
+        return compressor.compress(data) + compressor.flush()
+
+    def _compressed_blocks(self) -> Iterator[Union[bytes, memoryview]]:
+        if self._workers <= 1:
+            for data in self._data_blocks:
+                yield self._compress(data)
+            return
+
+        # zlib releases the GIL while compressing, only a few blocks
+        # are kept in flight to bound the memory usage
+        with ThreadPoolExecutor(self._workers) as executor:
+            pending: deque[Future[Union[bytes, memoryview]]] = deque()
+            for data in self._data_blocks:
+                pending.append(executor.submit(self._compress, data))
+                if len(pending) > self._workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _write_ver_header(self, file: BinaryIO):
         c_item = CVersionHeader()
         c_item.magic = c_rawstr4('DATA')
         c_item.version = c_int32(4)
 
-        self._data_file.append(c_item.to_data())
+        file.write(c_item.to_data())
+
+    def _get_layout(self):
+        # computed in one pass, cached until items are added
+        if self._layout is not None:
+            return self._layout
 
-    def _get_item_size(self):
-        item_size = 0
-        for type_id in sorted(self._items):
+        type_ids = sorted(self._items)
+        type_starts: list[int] = []
+        item_offsets: list[int] = []
+        next_offset = 0
+        for type_id in type_ids:
+            type_starts.append(len(item_offsets))
             for item_list in self._items[type_id]:
-                item_size += sum([item.size_bytes() for item in item_list]) + CItemHeader.size_bytes()
-        return item_size
+                item_offsets.append(next_offset)
+                next_offset += sum([item.size_bytes() for item in item_list]) + CItemHeader.size_bytes()
 
-    def _get_num_items(self):
-        num_items = 0
-        for type_id in sorted(self._items):
-            num_items += len(self._items[type_id])
-        return num_items
+        self._layout = ItemLayout(
+            type_ids=type_ids,
+            type_starts=type_starts,
+            item_offsets=item_offsets,
+            item_size=next_offset
+        )
+        return self._layout
 
     def _get_swaplen(self):
         swaplen = CHeader.size_bytes() - 2 * c_int32.size_bytes()  # remaining header
-        swaplen += len(self._item_types) * CItemType.size_bytes()
-        swaplen += len(self._get_item_offsets()) * c_int32.size_bytes()
-        swaplen += 2 * len(self._data_offsets) * c_int32.size_bytes()
-        swaplen += self._get_item_size()
+        layout = self._get_layout()
+        swaplen += len(layout.type_ids) * CItemType.size_bytes()
+        swaplen += len(layout.item_offsets) * c_int32.size_bytes()
+        swaplen += 2 * len(self._data_sizes) * c_int32.size_bytes()
+        swaplen += layout.item_size
         return swaplen
 
     def _get_size(self):
-        return self._get_swaplen() + len(self._data)
+        return self._get_swaplen() + self._data_size
+
+    def _write_header(self, file: BinaryIO):
+        layout = self._get_layout()
 
-    def _write_header(self):
         c_item = CHeader()
         c_item.size = c_int32(self._get_size())
         c_item.swaplen = c_int32(self._get_swaplen())
-        c_item.num_item_types = c_int32(len(self._item_types))
-        c_item.num_items = c_int32(self._get_num_items())
-        c_item.num_data = c_int32(len(self._data_offsets))
-        c_item.item_size = c_int32(self._get_item_size())
-        c_item.data_size = c_int32(len(self._data))
-
-        self._data_file.append(c_item.to_data())
+        c_item.num_item_types = c_int32(len(layout.type_ids))
+        c_item.num_items = c_int32(len(layout.item_offsets))
+        c_item.num_data = c_int32(len(self._data_sizes))
+        c_item.item_size = c_int32(layout.item_size)
+        c_item.data_size = c_int32(self._data_size)
 
-    def _write_item_types(self):
-        start = 0
-        for type_id in sorted(self._item_types):
-            num = len(self._items[type_id])
+        file.write(c_item.to_data())
 
+    def _write_item_types(self, file: BinaryIO):
+        layout = self._get_layout()
+        for type_id, start in zip(layout.type_ids, layout.type_starts):
             c_item = CItemType()
             c_item.type_id = c_int32(type_id)
             c_item.start = c_int32(start)
-            c_item.num = c_int32(num)
+            c_item.num = c_int32(len(self._items[type_id]))
 
-            self._data_file.append(c_item.to_data())
+            file.write(c_item.to_data())
 
-            start += num
+    @staticmethod
+    def _write_int32_list(file: BinaryIO, values: 'list[int]'):
+        file.write(struct.pack(f'<{len(values)}i', *values))
 
-    def _get_item_offsets(self):
-        offsets: list[int] = []
-        next_offset = 0
-        for type_id in sorted(self._items):
-            for item_list in self._items[type_id]:
-                offsets.append(next_offset)
-                next_offset += sum([item.size_bytes() for item in item_list]) + CItemHeader.size_bytes()
-        return offsets
-
-    def _write_size_indicators(self):
-        for offset in self._get_item_offsets():
-            self._data_file.append(c_int32(offset).to_data())
+    def _write_item_offsets(self, file: BinaryIO):
+        self._write_int32_list(file, self._get_layout().item_offsets)
 
-        for offset in self._data_offsets:
-            self._data_file.append(c_int32(offset).to_data())
+    def _write_data_offsets(self, file: BinaryIO):
+        self._write_int32_list(file, self._data_offsets)
 
-        for size in self._data_sizes:
-            self._data_file.append(c_int32(size).to_data())
+    def _write_data_sizes(self, file: BinaryIO):
+        self._write_int32_list(file, self._data_sizes)
 
-    def _write_items(self):
-        for type_id in sorted(self._items):
+    def _write_items(self, file: BinaryIO):
+        for type_id in self._get_layout().type_ids:
             for index, item_list in enumerate(self._items[type_id]):
                 item_bytes = b''.join([item.to_data() for item in item_list])
 
-                combined = index | (type_id << 16)
+                combined = self._item_ids.get((type_id, index), index) | (type_id << 16)
+                if combined >= 1 << 31:
+                    combined -= 1 << 32  # type ids of extension items set the sign bit
 
                 c_item = CItemHeader()
                 c_item.type_id_index = c_int32(combined)
                 c_item.size = c_int32(len(item_bytes))
 
-                self._data_file.append(c_item.to_data())
-                self._data_file.append(item_bytes)
-
-    def write(self, path: str):
-        self._write_ver_header()
-        self._write_header()
-        self._write_item_types()
-        self._write_size_indicators()
-        self._write_items()
-        self._data_file.append(self._data.read_all())
-
-        with open(path, 'wb') as file:
-            file.write(self._data_file.read_all())
+                file.write(c_item.to_data())
+                file.write(item_bytes)
+
+    def _write_data(self, file: Optional[BinaryIO], compressed_blocks: Iterable[Union[bytes, memoryview]]):
+        self._data_offsets = []
+        self._data_size = 0
+        for compressed_data in compressed_blocks:
+            self._data_offsets.append(self._data_size)
+            self._data_size += len(compressed_data)
+            if file is not None:
+                file.write(compressed_data)
+
+    def _write_file(self, file: BinaryIO):
+        seekable = file.seekable()
+        if seekable:
+            # data offsets and sizes are written again after streaming the data
+            compressed_blocks: Iterable[Union[bytes, memoryview]] = self._compressed_blocks()
+            self._data_offsets = [0] * len(self._data_sizes)
+            self._data_size = 0
+            start = file.tell()
+        else:
+            compressed_blocks = list(self._compressed_blocks())
+            self._write_data(None, compressed_blocks)
+            start = 0
+
+        self._write_ver_header(file)
+        self._write_header(file)
+        self._write_item_types(file)
+        self._write_item_offsets(file)
+        data_offsets_start = file.tell() if seekable else 0
+        self._write_data_offsets(file)
+        self._write_data_sizes(file)
+        self._write_items(file)
+        self._write_data(file, compressed_blocks)
+
+        if seekable:
+            end = file.tell()
+            file.seek(start)
+            self._write_ver_header(file)
+            self._write_header(file)
+            file.seek(data_offsets_start)
+            self._write_data_offsets(file)
+            file.seek(end)
+
+    def write(self, file: 'Union[str, os.PathLike[str], BinaryIO]'):
+        if not isinstance(file, (str, os.PathLike)):
+            self._write_file(file)
+            return
+
+        # write to a temporary file first, this keeps the old map intact
+        # if writing fails and while it might still be memory-mapped
+        temp_path = f'{os.fspath(file)}.{secrets.token_hex(4)}.tmp'
+        try:
+            with open(temp_path, 'xb') as temp_file:
+                self._write_file(temp_file)
+            os.replace(temp_path, file)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
@@ -0,0 +1,276 @@
+import struct
+import zlib
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from pytwmap.items import QUAD_DTYPE, ItemImage, ItemLayer, ItemQuadLayer, ItemSoundLayer, ItemTileLayer, QuadBuffer
+from pytwmap.tilemanager import TileManager
+from pytwmap.twmap import TWMap
+
+
+PATCH_MAGIC = b'TWPT'
+PATCH_VERSION = 1
+
+# kinds of the patch entries
+_PATCH_TILES = 0
+_PATCH_RESIZE = 1
+_PATCH_QUADS = 2
+
+
+class Rect(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class LayerDiff(NamedTuple):
+    group: int  # indices in the new map
+    layer: int
+    old_group: int  # indices in the old map
+    old_layer: int
+    kind: str
+    name: str
+    rects: List[Rect]  # changed tiles, the whole layer if it was resized
+    resized: bool = False
+
+
+class MapDiff(NamedTuple):
+    layers: List[LayerDiff]
+    added_layers: List[Tuple[int, int]]  # indices in the new map
+    removed_layers: List[Tuple[int, int]]  # indices in the old map
+    reordered: bool
+    added_images: List[str]
+    removed_images: List[str]
+    changed_images: List[str]
+
+    @property
+    def changed(self):
+        return bool(self.layers or self.added_layers or self.removed_layers or self.reordered
+                    or self.added_images or self.removed_images or self.changed_images)
+
+    @property
+    def patchable(self):
+        # patches only contain the changes of layers that exist in both maps
+        return not (self.added_layers or self.removed_layers or self.reordered
+                    or self.added_images or self.removed_images or self.changed_images)
+
+
+def _runs(mask: np.ndarray) -> 'List[Tuple[int, int]]':
+    # (begin, end) of every run of set values
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def _changed_rects(changed: np.ndarray):
+    # consecutive changed rows are merged into bands, changed columns of a band into rects
+    rects: list[Rect] = []
+    for y_begin, y_end in _runs(changed.any(axis=1)):
+        for x_begin, x_end in _runs(changed[y_begin:y_end].any(axis=0)):
+            rects.append(Rect(x_begin, y_begin, x_end - x_begin, y_end - y_begin))
+    return rects
+
+
+def _same_block(old: TileManager, new: TileManager):
+    # unmodified layers are compared without decompressing them
+    old_block, new_block = old.source_block, new.source_block
+    if old_block is None or new_block is None:
+        return False
+    return old_block == new_block or old_block._compressed_view() == new_block._compressed_view()
+
+
+def diff_tiles(old: TileManager, new: TileManager):
+    """Returns the rects containing all changed tiles of two layers with the same size."""
+    assert type(old) == type(new)
+    assert (old.width, old.height) == (new.width, new.height)
+
+    if old is new or _same_block(old, new):
+        return []
+
+    old_bytes = old.read_array().view(np.uint8).reshape(old.height, old.width, old._tile_bytes)
+    new_bytes = new.read_array().view(np.uint8).reshape(new.height, new.width, new._tile_bytes)
+    return _changed_rects((old_bytes != new_bytes).any(axis=2))
+
+
+def _layer_kind(twmap: TWMap, layer: ItemLayer):
+    for kind in ['game', 'tele', 'speedup', 'front', 'switch', 'tune']:
+        if layer is getattr(twmap, f'{kind}_layer'):
+            return kind
+    if isinstance(layer, ItemQuadLayer):
+        return 'quads'
+    if isinstance(layer, ItemSoundLayer):
+        return 'sounds'
+    return 'tiles'
+
+
+def _layer_keys(twmap: TWMap):
+    # layers are matched by group name, kind and name, equal ones by their order
+    keys: dict[tuple[str, str, str, int], tuple[int, int]] = {}
+    counts: dict[tuple[str, str, str], int] = {}
+    for group_index, group in enumerate(twmap.groups):
+        for layer_index, layer in enumerate(group.layers):
+            key = (group.name, _layer_kind(twmap, layer), layer.name)
+            counts[key] = counts.get(key, -1) + 1
+            keys[key + (counts[key],)] = (group_index, layer_index)
+    return keys
+
+
+def _image_data(image: ItemImage):
+    if image.external:
+        return None
+    if image.source_block is not None:
+        return image.source_block.decompress()
+    return image.image.tobytes()
+
+
+def _diff_images(old: TWMap, new: TWMap):
+    old_images = {image.name: image for image in old.images}
+    new_images = {image.name: image for image in new.images}
+
+    changed: list[str] = []
+    for name in old_images.keys() & new_images.keys():
+        old_image, new_image = old_images[name], new_images[name]
+        if old_image is new_image:
+            continue
+        if (old_image.external, old_image.width, old_image.height) != (new_image.external, new_image.width, new_image.height):
+            changed.append(name)
+        elif _image_data(old_image) != _image_data(new_image):
+            changed.append(name)
+
+    return (
+        [name for name in new_images if name not in old_images],
+        [name for name in old_images if name not in new_images],
+        sorted(changed)
+    )
+
+
+def _diff_layer(old_map: TWMap, new_map: TWMap, old: ItemLayer, new: ItemLayer,
+                indices: Tuple[int, int, int, int], kind: str) -> Optional[LayerDiff]:
+    if isinstance(old, ItemTileLayer) and isinstance(new, ItemTileLayer):
+        if (old.width, old.height) != (new.width, new.height) or type(old.tiles) != type(new.tiles):
+            return LayerDiff(*indices, kind, new.name, [Rect(0, 0, new.width, new.height)], resized=True)
+        rects = diff_tiles(old.tiles, new.tiles)
+        if rects:
+            return LayerDiff(*indices, kind, new.name, rects)
+    elif isinstance(old, ItemQuadLayer) and isinstance(new, ItemQuadLayer):
+        # the envelopes are compared by their index in the maps
+        if old.quads.tobytes(old_map.envelopes) != new.quads.tobytes(new_map.envelopes):
+            return LayerDiff(*indices, kind, new.name, [])
+    return None
+
+
+def diff_maps(old: TWMap, new: TWMap):
+    """Compares the layers and images of two maps."""
+    old_keys = _layer_keys(old)
+    new_keys = _layer_keys(new)
+
+    layers: list[LayerDiff] = []
+    for key, (group_index, layer_index) in new_keys.items():
+        if key not in old_keys:
+            continue
+        old_group, old_layer = old_keys[key]
+        layer_diff = _diff_layer(
+            old,
+            new,
+            old.groups[old_group].layers[old_layer],
+            new.groups[group_index].layers[layer_index],
+            (group_index, layer_index, old_group, old_layer),
+            key[1]
+        )
+        if layer_diff is not None:
+            layers.append(layer_diff)
+
+    common = [key for key in new_keys if key in old_keys]
+    added_images, removed_images, changed_images = _diff_images(old, new)
+
+    return MapDiff(
+        layers=layers,
+        added_layers=[new_keys[key] for key in new_keys if key not in old_keys],
+        removed_layers=[old_keys[key] for key in old_keys if key not in new_keys],
+        reordered=[old_keys[key] for key in common] != sorted(old_keys[key] for key in common),
+        added_images=added_images,
+        removed_images=removed_images,
+        changed_images=changed_images
+    )
+
+
+def create_patch(old: TWMap, new: TWMap, level: int = 9):
+    """Returns a patch containing the changed tiles and quads that turns old into new."""
+    map_diff = diff_maps(old, new)
+    if not map_diff.patchable:
+        raise RuntimeError('layers or images were added, removed or reordered')
+
+    body: list[bytes] = [struct.pack('<I', len(map_diff.layers))]
+    for layer_diff in map_diff.layers:
+        layer = new.groups[layer_diff.group].layers[layer_diff.layer]
+        # the patch is applied to the old map, groups or layers before this one may have been inserted
+        header = struct.pack('<HH', layer_diff.old_group, layer_diff.old_layer)
+
+        if isinstance(layer, ItemQuadLayer):
+            body.append(header + struct.pack('<BI', _PATCH_QUADS, len(layer.quads)))
+            body.append(layer.quads.tobytes(new.envelopes))
+        elif isinstance(layer, ItemTileLayer):
+            tiles = layer.tiles.read_array()  # type: ignore
+            if layer_diff.resized:
+                body.append(header + struct.pack('<BII', _PATCH_RESIZE, layer.width, layer.height))
+                body.append(tiles.tobytes())
+                continue
+
+            body.append(header + struct.pack('<BI', _PATCH_TILES, len(layer_diff.rects)))
+            for rect in layer_diff.rects:
+                body.append(struct.pack('<IIII', *rect))
+                body.append(tiles[rect.y:rect.y + rect.height, rect.x:rect.x + rect.width].tobytes())
+
+    return PATCH_MAGIC + struct.pack('<I', PATCH_VERSION) + zlib.compress(b''.join(body), level)
+
+
+def apply_patch(twmap: TWMap, patch: bytes):
+    """Applies a patch created by create_patch to the map it was created from."""
+    if patch[:4] != PATCH_MAGIC:
+        raise RuntimeError('wrong magic bytes')
+    if struct.unpack_from('<I', patch, 4)[0] != PATCH_VERSION:
+        raise RuntimeError('unsupported patch version')
+
+    body = zlib.decompress(patch[8:])
+    num_layers, = struct.unpack_from('<I', body, 0)
+    offset = 4
+    for _ in range(num_layers):
+        group_index, layer_index, kind = struct.unpack_from('<HHB', body, offset)
+        offset += 5
+        layer = twmap.groups[group_index].layers[layer_index]
+
+        if kind == _PATCH_QUADS:
+            assert isinstance(layer, ItemQuadLayer)
+            num_quads, = struct.unpack_from('<I', body, offset)
+            offset += 4
+            size = num_quads * QUAD_DTYPE.itemsize
+            layer.quads = QuadBuffer.from_bytes(body[offset:offset + size], num_quads, twmap.envelopes)
+            offset += size
+            continue
+
+        assert isinstance(layer, ItemTileLayer)
+        tiles: TileManager = layer.tiles  # type: ignore
+        if kind == _PATCH_RESIZE:
+            width, height = struct.unpack_from('<II', body, offset)
+            offset += 8
+            tiles.resize(width, height)
+            size = width * height * tiles._tile_bytes
+            tiles.raw_data[:] = body[offset:offset + size]
+            offset += size
+        elif kind == _PATCH_TILES:
+            num_rects, = struct.unpack_from('<I', body, offset)
+            offset += 4
+            array = tiles.array
+            for _ in range(num_rects):
+                rect = Rect(*struct.unpack_from('<IIII', body, offset))
+                offset += 16
+                size = rect.width * rect.height * tiles._tile_bytes
+                region = np.frombuffer(body, dtype=tiles._dtype, count=rect.width * rect.height, offset=offset)
+                array[rect.y:rect.y + rect.height, rect.x:rect.x + rect.width] = region.reshape(rect.height, rect.width)
+                offset += size
+        else:
+            raise RuntimeError('unknown patch entry')
+
+    if offset != len(body):
+        raise RuntimeError('patch has trailing data')
@@ -1,23 +1,64 @@
 from PIL import Image
-from typing import Generic, Optional, TypeVar, Tuple, List
+from typing import TYPE_CHECKING, Callable, Generic, Iterable, Optional, Sequence, TypeVar, Tuple, List, Union, overload
 import os
+import numpy as np
 
-from pytwmap.structs import c_intstr3, c_int32
+from pytwmap.constants import ItemType, LayerType
+from pytwmap.structs import c_intstr3, c_intstr8, c_int32
+from pytwmap.map_structs import CQuad
 from pytwmap.tilemanager import TileManager
+from pytwmap.pyramid import TilePyramid
+
+if TYPE_CHECKING:
+    from pytwmap.datafile_reader import DataBlock
 
 
 TITEM = TypeVar('TITEM', bound='Item')
 TMANAGER = TypeVar('TMANAGER', bound=TileManager)
 
 
+# PyBUF_WRITABLE of the buffer protocol
+_BUFFER_WRITABLE = 1
+
+
 TPoint = Tuple[int, int]
 TColor = Tuple[int, int, int, int]
 
 
+# memory layout of CQuad
+QUAD_DTYPE = np.dtype([
+    ('positions', '<i4', (5, 2)),
+    ('colors', '<i4', (4, 4)),
+    ('texture_coordinates', '<i4', (4, 2)),
+    ('position_envelope_ref', '<i4'),
+    ('position_envelope_offset', '<i4'),
+    ('color_envelope_ref', '<i4'),
+    ('color_envelope_offset', '<i4')
+])
+assert QUAD_DTYPE.itemsize == CQuad.size_bytes()
+
+
 class Item:
     pass
 
 
+class ItemRaw(Item):
+    def __init__(self,
+                 type_id: int,
+                 data: bytes,
+                 id: int = 0,
+                 data_blocks: 'Optional[dict[int, DataBlock]]' = None):
+        # items that are not parsed keep their data as it was read,
+        # data_blocks maps the int32 fields that are data pointers to their blocks
+        self.type_id = type_id
+        self.id = id
+        self.data = data
+        self.data_blocks = data_blocks if data_blocks is not None else {}
+
+    def __repr__(self):
+        return f'<item_raw: {self.type_id}:{self.id}>'
+
+
 class ItemVersion(Item):
     def __init__(self, version: int):
         self.version = version
@@ -39,6 +80,20 @@ class ItemInfo(Item):
         self.license = license
         self.settings = settings  # TODO: a nicer interface for this?
 
+        # data blocks the values were loaded from
+        self._blocks: 'dict[str, Tuple[object, DataBlock]]' = {}
+
+    def _set_source_block(self, field: str, block: 'DataBlock'):
+        value = getattr(self, field)
+        self._blocks[field] = (list(value) if isinstance(value, list) else value, block)
+
+    def get_source_block(self, field: str):
+        if field in self._blocks:
+            value, block = self._blocks[field]
+            if getattr(self, field) == value:
+                return block
+        return None
+
     def __repr__(self):
         return f'<item_info>'
 
@@ -48,9 +103,23 @@ class ItemImage(Item):
         raise NotImplementedError()
 
     def set_internal(self, image: Image.Image, name: str):
-        self._image = image
+        self._image: Optional[Image.Image] = image
+        self._pixels: Optional[bytearray] = None
+        self._shared_image: Optional[Image.Image] = None
+        self._size = image.size
         self._name = name
         self._external = False
+        self._block: 'Optional[DataBlock]' = None
+
+    def _set_block(self, block: 'DataBlock', width: int, height: int, pixels: Optional[bytes] = None):
+        # the image is decoded on first access if the pixels are not given
+        self._image = None
+        self._pixels = None
+        self._size = (width, height)
+        self._shared_image = None
+        self._block = block
+        if pixels is not None:
+            self._share_pixels(bytearray(pixels))
 
     @staticmethod
     def _remove_file_extension(name: str):
@@ -73,34 +142,97 @@ class ItemImage(Item):
 
     def set_external(self, name: str):
         self._image = Image.open(self._get_external_path(name))
+        self._pixels = None
+        self._shared_image = None
+        self._size = self._image.size
         self._name = name
         self._external = True
+        self._block = None
 
     @property
     def external(self):
         return self._external
 
+    def _load_pixels(self) -> bytearray:
+        # images created from the pixels share their memory until they are modified, PIL then copies them.
+        # Other images, e.g. the ones passed to set_internal, stay the source of the pixels,
+        # they are read again on every access
+        if self._image is None:
+            assert self._block is not None
+            self._share_pixels(bytearray(self._block.decompress()))
+        elif self._image is not self._shared_image or not self._image.readonly:
+            self._pixels = bytearray(self._image.convert('RGBA').tobytes())
+        assert self._pixels is not None
+        return self._pixels
+
+    def _share_pixels(self, pixels: bytearray):
+        self._pixels = pixels
+        self._image = self._shared_image = Image.frombuffer('RGBA', self._size, pixels, 'raw', 'RGBA', 0, 1)
+
     @property
     def image(self):
+        if self._image is None:
+            self._load_pixels()
+
+        # the image can be modified in place
+        self._block = None
         return self._image
 
+    def view(self, readonly: bool = True):
+        # rgba pixels with shape (height, width, 4), shared with image if it was created from them,
+        # writing to the pixels of another image replaces it by one sharing them
+        pixels = self._load_pixels()
+        if not readonly and self._image is not self._shared_image:
+            self._share_pixels(pixels)
+        view = memoryview(pixels).cast('B', (self.height, self.width, 4))
+        if readonly:
+            return view.toreadonly()
+
+        self._block = None
+        return view
+
+    def __buffer__(self, flags: int):
+        return self.view(readonly=not flags & _BUFFER_WRITABLE)
+
+    def __array__(self, dtype: Optional[np.dtype] = None, copy: Optional[bool] = None):
+        array = np.asarray(self.view())
+        if copy:
+            array = array.copy()
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    @property
+    def dirty(self):
+        return self._block is None
+
+    @property
+    def source_block(self):
+        return self._block
+
     @property
     def name(self):
         return self._name
 
     @property
     def width(self):
-        return self._image.width
+        return self._size[0]
 
     @property
     def height(self):
-        return self._image.height
+        return self._size[1]
 
 
 class ItemImageInternal(ItemImage):
     def __init__(self, image: Image.Image, name: str,):
         self.set_internal(image, name)
 
+    @classmethod
+    def _from_block(cls, block: 'DataBlock', width: int, height: int, name: str, pixels: Optional[bytes] = None):
+        instance = cls.__new__(cls)
+        instance._name = name
+        instance._external = False
+        instance._set_block(block, width, height, pixels)
+        return instance
+
     @ItemImage.name.setter
     def name(self, name: str):
         # TODO: check if name is valid
@@ -124,8 +256,22 @@ class ItemImageExternal(ItemImage):
             return f'<image_external: {hex(id(self))}>'
 
 
-class ItemEnvelope(Item):
-    pass
+class ItemEnvelope(ItemRaw):
+    def __init__(self, data: bytes):
+        super().__init__(ItemType.ENVELOPE, data)
+
+    @property
+    def name(self):
+        # the name follows version, channels, start_point and num_points
+        if len(self.data) < 16 + c_intstr8.size_bytes():
+            return ''
+        return c_intstr8._decode(self.data[16:16 + c_intstr8.size_bytes()])
+
+    def __repr__(self):
+        if self.name:
+            return f'<envelope: {self.name}>'
+        else:
+            return f'<envelope: {hex(id(self))}>'
 
 
 class ItemLayer(Item):
@@ -162,10 +308,13 @@ class ItemTileLayer(ItemLayer, Generic[TMANAGER]):
 
         self._tiles = tiles
 
+        # pyramids with the revision of the tiles they were built from
+        self._pyramids: dict[tuple[Optional[str], object], tuple[int, TilePyramid]] = {}
+
     # TODO: should these be properties -> typechecked or just have them be variables
     @property
     def color_envelope(self):
-        self._color_envelope_ref
+        return self._color_envelope_ref
 
     @color_envelope.setter
     def color_envelope(self, item: Optional[ItemEnvelope]):
@@ -203,6 +352,25 @@ class ItemTileLayer(ItemLayer, Generic[TMANAGER]):
     @tiles.setter
     def tiles(self, tiles: TMANAGER):
         self._tiles = tiles
+        self._pyramids = {}
+
+    def pyramid(self, value: 'Optional[Union[int, Sequence[int]]]' = None, field: Optional[str] = None):
+        # cached until the tiles are modified, like the index changes made
+        # through an array that was fetched before are not noticed
+        key = (field, value if value is None or isinstance(value, int) else tuple(value))
+        cached = self._pyramids.get(key)
+        if cached is not None and cached[0] == self._tiles.revision:
+            return cached[1]
+
+        pyramid = TilePyramid.from_tiles(self._tiles, value, field)
+        self._pyramids[key] = (self._tiles.revision, pyramid)
+        return pyramid
+
+    def label_regions(self,
+                      value: 'Union[int, Sequence[int], Callable[[np.ndarray], np.ndarray]]',
+                      field: Optional[str] = None,
+                      connectivity: int = 4):
+        return self._tiles.label_regions(value, field, connectivity)
 
     def __repr__(self):
         if self.name:
@@ -211,6 +379,20 @@ class ItemTileLayer(ItemLayer, Generic[TMANAGER]):
             return f'<tile_layer: {hex(id(self))}>'
 
 
+def _envelope_index(envelopes: 'list[ItemEnvelope]', envelope: ItemEnvelope, add: bool = True):
+    # envelopes are compared by identity, -1 if it is missing and not added
+    for i, other in enumerate(envelopes):
+        if other is envelope:
+            return i
+    if not add:
+        return -1
+    envelopes.append(envelope)
+    return len(envelopes) - 1
+
+
+_ENVELOPE_REF_FIELDS = ['position_envelope_ref', 'color_envelope_ref']
+
+
 class ItemQuad(Item):
     def __init__(self,
                  corners: Tuple[TPoint, TPoint, TPoint, TPoint],
@@ -221,6 +403,9 @@ class ItemQuad(Item):
                  position_envelope_offset: int = 0,
                  color_envelope_ref: Optional[ItemEnvelope] = None,
                  color_envelope_offset: int = 0):
+        self._row = np.zeros((), dtype=QUAD_DTYPE)
+        self._envelopes: list[ItemEnvelope] = []
+
         self.corners = corners
         self.pivot = pivot
         self.corner_colors = corner_colors
@@ -230,10 +415,267 @@ class ItemQuad(Item):
         self.color_envelope_ref = color_envelope_ref
         self.color_envelope_offset = color_envelope_offset
 
+    @classmethod
+    def _from_row(cls, row: np.ndarray, envelopes: 'list[ItemEnvelope]'):
+        # view on a row of a QuadBuffer, changes are written through,
+        # the envelope refs of the row are indices into envelopes
+        instance = cls.__new__(cls)
+        instance._row = row
+        instance._envelopes = envelopes
+        return instance
+
+    def _get_envelope(self, field: str) -> Optional[ItemEnvelope]:
+        index = int(self._row[field])
+        if index < 0:
+            return None
+        if index >= len(self._envelopes):
+            raise RuntimeError(f'{field} {index} is not a valid envelope index')
+        return self._envelopes[index]
+
+    def _set_envelope(self, field: str, envelope: Optional[ItemEnvelope]):
+        self._row[field] = -1 if envelope is None else _envelope_index(self._envelopes, envelope)
+
+    @property
+    def corners(self) -> Tuple[TPoint, TPoint, TPoint, TPoint]:
+        return tuple(map(tuple, self._row['positions'][:4].tolist()))  # type: ignore
+
+    @corners.setter
+    def corners(self, value: Tuple[TPoint, TPoint, TPoint, TPoint]):
+        self._row['positions'][:4] = value
+
+    @property
+    def pivot(self) -> TPoint:
+        return tuple(self._row['positions'][4].tolist())  # type: ignore
+
+    @pivot.setter
+    def pivot(self, value: TPoint):
+        self._row['positions'][4] = value
+
+    @property
+    def corner_colors(self) -> Tuple[TColor, TColor, TColor, TColor]:
+        return tuple(map(tuple, self._row['colors'].tolist()))  # type: ignore
+
+    @corner_colors.setter
+    def corner_colors(self, value: Tuple[TColor, TColor, TColor, TColor]):
+        self._row['colors'] = value
+
+    @property
+    def texture_coords(self) -> Tuple[TPoint, TPoint, TPoint, TPoint]:
+        return tuple(map(tuple, self._row['texture_coordinates'].tolist()))  # type: ignore
+
+    @texture_coords.setter
+    def texture_coords(self, value: Tuple[TPoint, TPoint, TPoint, TPoint]):
+        self._row['texture_coordinates'] = value
+
+    @property
+    def position_envelope_ref(self):
+        return self._get_envelope('position_envelope_ref')
+
+    @position_envelope_ref.setter
+    def position_envelope_ref(self, envelope: Optional[ItemEnvelope]):
+        self._set_envelope('position_envelope_ref', envelope)
+
+    @property
+    def position_envelope_offset(self) -> int:
+        return int(self._row['position_envelope_offset'])
+
+    @position_envelope_offset.setter
+    def position_envelope_offset(self, value: int):
+        self._row['position_envelope_offset'] = value
+
+    @property
+    def color_envelope_ref(self):
+        return self._get_envelope('color_envelope_ref')
+
+    @color_envelope_ref.setter
+    def color_envelope_ref(self, envelope: Optional[ItemEnvelope]):
+        self._set_envelope('color_envelope_ref', envelope)
+
+    @property
+    def color_envelope_offset(self) -> int:
+        return int(self._row['color_envelope_offset'])
+
+    @color_envelope_offset.setter
+    def color_envelope_offset(self, value: int):
+        self._row['color_envelope_offset'] = value
+
+
+class QuadBuffer:
+    """Stores quads in a numpy array with one QUAD_DTYPE row per quad.
+
+    Indexing returns an ItemQuad view on the row, slicing a list of views.
+    Views are invalidated when quads are added or removed, pop returns a copy.
+    The envelope refs of the rows are indices into the envelopes of the buffer,
+    tobytes and from_bytes translate them to and from the envelopes of a map.
+    """
+
+    def __init__(self, quads: Iterable[ItemQuad] = ()):
+        self._envelopes: list[ItemEnvelope] = []
+        quad_rows = [self._import_row(quad) for quad in quads]
+        self._array = np.array(quad_rows, dtype=QUAD_DTYPE).reshape(len(quad_rows))
+        self._size = len(quad_rows)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, num_quads: int, envelopes: 'Sequence[ItemEnvelope]' = ()):
+        # the envelope refs of the data are indices into envelopes
+        instance = cls()
+        instance._array = np.frombuffer(data, dtype=QUAD_DTYPE, count=num_quads).copy()
+        instance._size = num_quads
+        instance._envelopes = list(envelopes)
+        return instance
+
+    def tobytes(self, envelopes: 'Optional[Sequence[ItemEnvelope]]' = None):
+        # the envelope refs are written as indices into envelopes, every referenced one must be in it
+        if envelopes is None:
+            return self.array.tobytes()
+        array = self.array
+        mapping = np.array([_envelope_index(list(envelopes), envelope, add=False) for envelope in self._envelopes], dtype=np.int32)
+        if np.array_equal(mapping, np.arange(len(mapping))):
+            return array.tobytes()
+
+        array = array.copy()
+        for field in _ENVELOPE_REF_FIELDS:
+            refs = array[field]
+            used = refs >= 0
+            if (refs[used] >= len(mapping)).any():
+                raise RuntimeError(f'{field} is not a valid envelope index')
+            refs[used] = mapping[refs[used]]
+            if (refs[used] < 0).any():
+                raise RuntimeError('a quad references an envelope that is not in the envelopes')
+        return array.tobytes()
+
+    @property
+    def envelopes(self):
+        # the envelopes referenced by the quads
+        used = np.unique(np.concatenate([self.array[field] for field in _ENVELOPE_REF_FIELDS]))
+        return [self._envelopes[i] for i in used[(used >= 0) & (used < len(self._envelopes))].tolist()]
+
+    @property
+    def array(self) -> np.ndarray:
+        return self._array[:self._size]
+
+    def _import_row(self, quad: ItemQuad, add: bool = True):
+        # copy of the row of a quad with envelope refs of this buffer, None if one is missing
+        if quad._envelopes is self._envelopes:
+            return quad._row.copy()
+        row = quad._row.copy()
+        for field in _ENVELOPE_REF_FIELDS:
+            envelope = quad._get_envelope(field)
+            if envelope is not None:
+                row[field] = _envelope_index(self._envelopes, envelope, add)
+                if row[field] < 0:
+                    return None
+        return row
+
+    def _check_index(self, index: int):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('quad index out of range')
+        return index
+
+    def _reserve(self, size: int):
+        if size > len(self._array):
+            # grow geometrically to keep appending amortized constant
+            grown = np.zeros(max(8, 2 * self._size, size), dtype=QUAD_DTYPE)
+            grown[:self._size] = self.array
+            self._array = grown
+
+    def __len__(self):
+        return self._size
+
+    @overload
+    def __getitem__(self, index: int) -> ItemQuad: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> 'list[ItemQuad]': ...
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [ItemQuad._from_row(self._array[i, ...], self._envelopes) for i in range(*index.indices(self._size))]
+        return ItemQuad._from_row(self._array[self._check_index(index), ...], self._envelopes)
+
+    def __setitem__(self, index: Union[int, slice], quad: Union[ItemQuad, Iterable[ItemQuad]]):
+        if not isinstance(index, slice):
+            assert isinstance(quad, ItemQuad)
+            self._array[self._check_index(index)] = self._import_row(quad)
+            return
+
+        assert not isinstance(quad, ItemQuad)
+        rows = np.array([self._import_row(q) for q in quad], dtype=QUAD_DTYPE).reshape(-1)
+        start, stop, step = index.indices(self._size)
+        if step != 1:
+            indices = range(start, stop, step)
+            if len(rows) != len(indices):
+                raise ValueError(f'attempt to assign sequence of size {len(rows)} to extended slice of size {len(indices)}')
+            self._array[list(indices)] = rows
+            return
+
+        # like lists the slice is replaced by any number of quads
+        stop = max(start, stop)
+        array = np.concatenate([self._array[:start], rows, self._array[stop:self._size]])
+        self._size = len(array)
+        self._array = array
+
+    def __delitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            removed = list(range(*index.indices(self._size)))
+            self._array = np.delete(self.array, removed)
+            self._size = len(self._array)
+            return
+
+        index = self._check_index(index)
+        self._array[index:self._size-1] = self._array[index+1:self._size]
+        self._size -= 1
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield ItemQuad._from_row(self._array[i, ...], self._envelopes)
+
+    def append(self, quad: ItemQuad):
+        self._reserve(self._size + 1)
+        self._array[self._size] = self._import_row(quad)
+        self._size += 1
+
+    def extend(self, quads: Iterable[ItemQuad]):
+        for quad in quads:
+            self.append(quad)
+
+    def insert(self, index: int, quad: ItemQuad):
+        # like lists indices out of range insert at the start or end
+        row = self._import_row(quad)
+        index = min(max(index + self._size if index < 0 else index, 0), self._size)
+        self._reserve(self._size + 1)
+        self._array[index + 1:self._size + 1] = self._array[index:self._size]
+        self._array[index] = row
+        self._size += 1
+
+    def index(self, quad: ItemQuad):
+        # quads are equal if all their values and envelopes are
+        row = self._import_row(quad, add=False)
+        if row is not None:
+            rows = self.array.view(np.uint8).reshape(self._size, QUAD_DTYPE.itemsize)
+            found = np.flatnonzero((rows == np.frombuffer(row.tobytes(), dtype=np.uint8)).all(axis=1))
+            if len(found):
+                return int(found[0])
+        raise ValueError('quad is not in the buffer')
+
+    def remove(self, quad: ItemQuad):
+        del self[self.index(quad)]
+
+    def pop(self, index: int = -1):
+        index = self._check_index(index)
+        quad = ItemQuad._from_row(self._array[index].copy(), list(self._envelopes))
+        del self[index]
+        return quad
+
+    def clear(self):
+        self._size = 0
+
 
 class ItemQuadLayer(ItemLayer):
     def __init__(self,
-                 quads: List[ItemQuad],
+                 quads: Union[QuadBuffer, List[ItemQuad]],
                  image_ref: Optional[ItemImage] = None,
                  detail: bool = False,
                  name: str = ''):
@@ -242,6 +684,16 @@ class ItemQuadLayer(ItemLayer):
         self.quads = quads
         self.image = image_ref
 
+    @property
+    def quads(self):
+        return self._quads
+
+    @quads.setter
+    def quads(self, quads: Union[QuadBuffer, List[ItemQuad]]):
+        if not isinstance(quads, QuadBuffer):
+            quads = QuadBuffer(quads)
+        self._quads = quads
+
     @property
     def image(self):
         return self._image_ref
@@ -258,7 +710,26 @@ class ItemQuadLayer(ItemLayer):
 
 
 class ItemSoundLayer(ItemLayer):
-    pass
+    def __init__(self,
+                 sources: 'Union[bytes, DataBlock]',
+                 num_sources: int,
+                 sound_ref: 'Optional[ItemSound]' = None,
+                 layer_type: LayerType = LayerType.SOUNDS,
+                 detail: bool = False,
+                 name: str = ''):
+        super().__init__(detail, name)
+
+        # the sound sources are not parsed, they are copied as they are
+        self.sources = sources
+        self.num_sources = num_sources
+        self.sound = sound_ref
+        self.layer_type = layer_type
+
+    def __repr__(self):
+        if self.name:
+            return f'<sound_layer: {self.name}>'
+        else:
+            return f'<sound_layer: {hex(id(self))}>'
 
 
 class ItemGroup(Item):
@@ -375,5 +846,9 @@ class ItemGroup(Item):
             return f'<group: {hex(id(self))}>'
 
 
-class ItemSound(Item):
-    pass
+class ItemSound(ItemRaw):
+    def __init__(self, data: bytes, data_blocks: 'Optional[dict[int, DataBlock]]' = None):
+        super().__init__(ItemType.SOUND, data, data_blocks=data_blocks)
+
+    def __repr__(self):
+        return f'<sound: {hex(id(self))}>'
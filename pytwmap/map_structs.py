@@ -156,7 +156,12 @@ class CQuad(c_struct):
 
 
 class CItemSoundLayer(c_struct):
-    pass
+    version: c_int32
+    num_sources: c_int32
+    data_ptr: c_int32
+    sound_ref: c_int32
+
+    name: c_intstr3
 
 
 class CSoundShape(c_struct):
@@ -0,0 +1,49 @@
+from typing import NamedTuple, Optional
+
+from pytwmap.constants import LayerType
+from pytwmap.items import ItemInfo
+
+
+class DataBlockMetadata(NamedTuple):
+    index: int
+    compressed_size: int
+    size: int
+
+
+class ImageMetadata(NamedTuple):
+    index: int
+    name: str
+    width: int
+    height: int
+    external: bool
+    data_ptr: int
+
+
+class LayerMetadata(NamedTuple):
+    index: int
+    type: LayerType
+    name: str = ''
+    detail: bool = False
+    width: Optional[int] = None
+    height: Optional[int] = None
+    num_quads: Optional[int] = None
+    image_ref: int = -1
+    data_ptr: int = -1
+
+
+class GroupMetadata(NamedTuple):
+    index: int
+    name: str
+    layers: 'list[LayerMetadata]'
+
+
+class MapMetadata(NamedTuple):
+    item_types: 'dict[int, int]'
+    info: ItemInfo
+    images: 'list[ImageMetadata]'
+    groups: 'list[GroupMetadata]'
+    data_blocks: 'list[DataBlockMetadata]'
+
+    @property
+    def layers(self):
+        return [layer for group in self.groups for layer in group.layers]
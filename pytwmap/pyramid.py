@@ -0,0 +1,126 @@
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from pytwmap.tilemanager import TileManager
+
+
+def _quarters(array: np.ndarray):
+    # the four tiles of the 2x2 blocks of a level, odd sizes are padded with empty tiles
+    height, width = array.shape
+    padded = np.zeros((height + height % 2, width + width % 2), dtype=array.dtype)
+    padded[:height, :width] = array
+    return padded[0::2, 0::2], padded[0::2, 1::2], padded[1::2, 0::2], padded[1::2, 1::2]
+
+
+def _run_starts(keys: np.ndarray):
+    # first index of every run of equal keys
+    return np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+
+
+def _block_modes(values: np.ndarray, mask: np.ndarray, shapes: 'list[tuple[int, ...]]'):
+    # the most common selected value of the blocks of every level, ties go to the smaller value
+    # and blocks without selected tiles are 0, the runs of a level are merged into the next one
+    modes = [np.where(mask, values, 0).astype(values.dtype)]
+    modes += [np.zeros(shape, dtype=values.dtype) for shape in shapes[1:]]
+    ys, xs = np.nonzero(mask)
+    if not len(ys):
+        return modes
+
+    # every run of tiles with the same block and value is packed into one integer,
+    # sorting them orders the runs by block and value
+    selected = values[ys, xs]
+    candidates = np.unique(selected)
+    count_bits = len(ys).bit_length()
+    value_shift = count_bits
+    x_shift = value_shift + (len(candidates) - 1).bit_length()
+    y_shift = x_shift + (shapes[0][1] - 1).bit_length()
+    assert y_shift + (shapes[0][0] - 1).bit_length() <= 62, 'too many tiles to count'
+    x_mask = (1 << (y_shift - x_shift)) - 1
+    runs = ys.astype(np.int64) << y_shift | xs.astype(np.int64) << x_shift
+    runs |= np.searchsorted(candidates, selected).astype(np.int64) << value_shift | 1
+
+    for level in range(1, len(shapes)):
+        # halve the coordinates and merge the runs that end up in the same block with the same value
+        xs = (runs >> x_shift) & x_mask
+        runs = (runs >> (y_shift + 1)) << y_shift | (xs >> 1) << x_shift | (runs & ((1 << x_shift) - 1))
+        runs.sort()
+        starts = _run_starts(runs >> count_bits)
+        run_counts = np.add.reduceat(runs & ((1 << count_bits) - 1), starts)
+        runs = (runs[starts] >> count_bits) << count_bits | run_counts
+
+        # the first run with the highest count of every block has the smallest value
+        blocks = runs >> x_shift
+        block_starts = _run_starts(blocks)
+        highest = np.maximum.reduceat(run_counts, block_starts)
+        best = np.flatnonzero(run_counts == np.repeat(highest, np.diff(np.append(block_starts, len(runs)))))
+        best = runs[best[_run_starts(blocks[best])]]
+        value_indices = (best >> value_shift) & ((1 << (x_shift - value_shift)) - 1)
+        modes[level][best >> y_shift, (best >> x_shift) & x_mask] = candidates[value_indices]
+    return modes
+
+
+class TilePyramid:
+    """
+    Downsampled grids of a tile layer, level n has a cell for every block of 2**n x 2**n tiles.
+
+    counts holds the number of selected tiles of the blocks and majority the most common value
+    of the selected tiles, the smaller value on ties and 0 for blocks without selected tiles.
+    Level 0 are the tiles themselves and the last level is a single cell.
+    Arbitrary rects are counted with a summed-area table.
+    """
+
+    def __init__(self, values: np.ndarray, mask: np.ndarray):
+        assert values.shape == mask.shape
+        self.height, self.width = mask.shape
+
+        self.counts: list[np.ndarray] = [mask.astype(np.int32)]
+        while self.counts[-1].shape != (1, 1):
+            top_left, top_right, bottom_left, bottom_right = _quarters(self.counts[-1])
+            self.counts.append(top_left + top_right + bottom_left + bottom_right)
+        self.majority = _block_modes(values, mask, [level.shape for level in self.counts])
+
+        self._sums = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(mask, axis=0, dtype=np.int32), axis=1, out=self._sums[1:, 1:])
+
+    @classmethod
+    def from_tiles(cls,
+                   tiles: TileManager,
+                   value: 'Optional[Union[int, Sequence[int]]]' = None,
+                   field: Optional[str] = None):
+        # selects the tiles with one of the values of the field, all non-empty tiles without values
+        if field is None:
+            field = tiles._index_fields[0]
+        values = tiles.read_array()[field]
+        mask = values != 0 if value is None else np.isin(values, value)
+        return cls(values, mask)
+
+    @property
+    def num_levels(self):
+        return len(self.counts)
+
+    def occupied(self, level: int):
+        return self.counts[level] > 0
+
+    def block_count(self, level: int, x: 'np.ndarray | int', y: 'np.ndarray | int'):
+        # x and y are cell coordinates of the level, e.g. level 8 for blocks of 256x256 tiles
+        return self.counts[level][y, x]
+
+    def count(self,
+              x: 'np.ndarray | int',
+              y: 'np.ndarray | int',
+              width: 'np.ndarray | int',
+              height: 'np.ndarray | int'):
+        # number of selected tiles in the rects, parts outside of the layer are empty
+        x_begin, x_end = np.clip(x, 0, self.width), np.clip(np.add(x, width), 0, self.width)
+        y_begin, y_end = np.clip(y, 0, self.height), np.clip(np.add(y, height), 0, self.height)
+        x_end, y_end = np.maximum(x_end, x_begin), np.maximum(y_end, y_begin)
+        table = self._sums
+        return table[y_end, x_end] - table[y_begin, x_end] - table[y_end, x_begin] + table[y_begin, x_begin]
+
+    def any(self,
+            x: 'np.ndarray | int',
+            y: 'np.ndarray | int',
+            width: 'np.ndarray | int',
+            height: 'np.ndarray | int'):
+        return self.count(x, y, width, height) > 0
@@ -1,5 +1,8 @@
+from typing import Union
+
+
 class StringFile:
-    def __init__(self, data: bytes):
+    def __init__(self, data: Union[bytes, bytearray, memoryview]):
         self._data = data
         self._pointer = 0
 
@@ -18,8 +21,11 @@ class StringFile:
         self._pointer = pos
 
     def append(self, data: bytes):
+        # bytearray appends in amortized constant time
+        if not isinstance(self._data, bytearray):
+            self._data = bytearray(self._data)
         self._data += data
-        self._pointer = len(data)
+        self._pointer = len(self._data)
 
     def __len__(self):
         return len(self._data)
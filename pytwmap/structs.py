@@ -1,4 +1,7 @@
-from typing import Type, TypeVar, List
+import inspect
+import struct
+from array import array
+from typing import Any, Iterator, Type, TypeVar, List
 
 from pytwmap.stringfile import StringFile
 
@@ -7,19 +10,8 @@ T = TypeVar('T')
 TCTYPE = TypeVar('TCTYPE', bound='c_type')
 
 
-def safe_ord(char: str):
-    num = ord(char)
-    if num > 0x7F:
-        num = 0x100 - num
-        if num < 128:
-            return -num
-        else:
-            return -128
-    return num
-
-
-def safe_chr(i: int):
-    return chr(max(0, min(i if i >= 0 else 256 + i, 256)))
+# maps each byte to the byte with flipped sign bit (signed <-> unsigned char)
+_SIGN_FLIP = bytes(b ^ 0x80 for b in range(256))
 
 
 class c_type:
@@ -27,6 +19,12 @@ class c_type:
     def from_data(cls: Type[T], data: StringFile) -> T:
         raise NotImplementedError()
 
+    @classmethod
+    def from_data_list(cls: Type[T], data: StringFile, num: int) -> 'list[T]':
+        fmt = '<' + cls._format() * num  # type: ignore
+        values = iter(struct.unpack(fmt, data.read(struct.calcsize(fmt))))
+        return [cls._from_values(values) for _ in range(num)]  # type: ignore
+
     # TODO: make this take stringfile too?
     def to_data(self) -> bytes:
         raise NotImplementedError()
@@ -35,6 +33,20 @@ class c_type:
     def size_bytes(cls) -> int:
         raise NotImplementedError()
 
+    # the methods below are used to compile c_structs into a single struct.Struct
+
+    @classmethod
+    def _format(cls) -> str:
+        raise NotImplementedError()
+
+    @classmethod
+    def _from_values(cls, values: Iterator[Any]) -> Any:
+        raise NotImplementedError()
+
+    @classmethod
+    def _to_values(cls, value: Any, values: 'list[Any]'):
+        raise NotImplementedError()
+
 
 class c_int_impl(c_type, int):
     _num_bytes: int
@@ -63,6 +75,19 @@ class c_int_impl(c_type, int):
     def size_bytes(cls) -> int:
         return cls._num_bytes
 
+    @classmethod
+    def _format(cls):
+        fmt = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}[cls._num_bytes]
+        return fmt if cls._signed else fmt.upper()
+
+    @classmethod
+    def _from_values(cls, values: Iterator[Any]) -> int:
+        return next(values)
+
+    @classmethod
+    def _to_values(cls, value: int, values: 'list[Any]'):
+        values.append(value)
+
 
 class c_int32(c_int_impl):
     _num_bytes = 4
@@ -78,7 +103,10 @@ class c_str_impl(c_type, str):
 
     @classmethod
     def fits_str(cls, value: str):
-        return len(cls._encode(value)) == cls._length
+        try:
+            return len(cls._encode(value)) == cls._length
+        except UnicodeEncodeError:
+            return False
 
     @classmethod
     def _encode(cls, msg: str) -> bytes:
@@ -99,6 +127,18 @@ class c_str_impl(c_type, str):
     def size_bytes(cls) -> int:
         return cls._length
 
+    @classmethod
+    def _format(cls):
+        return f'{cls._length}s'
+
+    @classmethod
+    def _from_values(cls, values: Iterator[Any]) -> str:
+        return cls._decode(next(values))
+
+    @classmethod
+    def _to_values(cls, value: str, values: 'list[Any]'):
+        values.append(cls._encode(value))
+
 
 class c_rawstr4(c_str_impl):
     _length = 4
@@ -109,27 +149,25 @@ class c_rawstr4(c_str_impl):
 
     @classmethod
     def _decode(cls, msg: bytes):
-        return msg.decode('utf8')
+        return str(msg, 'utf8')
 
 
 class c_intstr_impl(c_str_impl):
+    # every char is stored as a signed byte, four of them packed big endian into an int
+
     @classmethod
     def _encode(cls, msg: str):
-        byte_msg = b''
-        msg = msg.ljust(cls._length, '\0')
-        for i in range(0, len(msg), 4):
-            for b in msg[i:i+4][::-1]:
-                byte_msg += bytes([safe_ord(b) + 128])
-        return byte_msg
+        data = bytearray(msg.ljust(cls._length, '\0').encode('latin-1').translate(_SIGN_FLIP))
+        data[-1] = 0  # the terminating char is stored unsigned
+        ints = array('i', data)
+        ints.byteswap()
+        return ints.tobytes()
 
     @classmethod
     def _decode(cls, msg: bytes):
-        str_msg = ''
-        for i in range(0, len(msg), 4):
-            for b in msg[i:i+4][::-1]:
-                str_msg += safe_chr(b - 128)
-
-        return str_msg[:-1].rstrip('\0')
+        ints = array('i', bytes(msg))
+        ints.byteswap()
+        return ints.tobytes().translate(_SIGN_FLIP).decode('latin-1')[:-1].rstrip('\0')
 
 
 class c_intstr3(c_intstr_impl):
@@ -140,28 +178,61 @@ class c_intstr8(c_intstr_impl):
     _length = 8 * c_int32.size_bytes()
 
 
+class c_bytes(c_type, bytes):
+    # unparsed item data, the size is only known per instance
+    def to_data(self):
+        return bytes(self)
+
+    def size_bytes(self) -> int:  # type: ignore
+        return len(self)
+
+
 class c_struct(c_type):
+    _fields: 'tuple[tuple[str, Type[c_type]], ...]'
+    _flat: bool
+    _struct: struct.Struct
+
+    def __init_subclass__(cls):
+        super().__init_subclass__()
+
+        # compile the annotated fields into a single struct
+        cls._fields = tuple(inspect.get_annotations(cls).items())
+        cls._flat = all(issubclass(attr_type, c_int_impl) for _, attr_type in cls._fields)
+        cls._struct = struct.Struct('<' + cls._format())
+
     @classmethod
     def from_data(cls: Type[T], data: StringFile) -> 'T':
-        instance = cls()
-        for var_name in cls.__annotations__:
-            attr_type = cls.__annotations__[var_name]
-            setattr(instance, var_name, attr_type.from_data(data))
-
-        return instance
+        values = cls._struct.unpack(data.read(cls._struct.size))  # type: ignore
+        if cls._flat:  # type: ignore
+            instance = cls()
+            instance.__dict__.update(zip([var_name for var_name, _ in cls._fields], values))  # type: ignore
+            return instance
+        return cls._from_values(iter(values))  # type: ignore
 
     def to_data(self):
-        ret = b''
-        for var_name in self.__annotations__:
-            ret += getattr(self, var_name).to_data()
-        return ret
+        values: 'list[Any]' = []
+        self._to_values(self, values)
+        return self._struct.pack(*values)
 
     @classmethod
     def size_bytes(cls) -> int:
-        size = 0
-        for var_name in cls.__annotations__:
-            size += cls.__annotations__[var_name].size_bytes()
-        return size
+        return cls._struct.size
+
+    @classmethod
+    def _format(cls):
+        return ''.join(attr_type._format() for _, attr_type in cls._fields)
+
+    @classmethod
+    def _from_values(cls, values: Iterator[Any]):
+        instance = cls()
+        for var_name, attr_type in cls._fields:
+            setattr(instance, var_name, attr_type._from_values(values))
+        return instance
+
+    @classmethod
+    def _to_values(cls, value: 'c_struct', values: 'list[Any]'):
+        for var_name, attr_type in cls._fields:
+            attr_type._to_values(getattr(value, var_name), values)
 
 
 class c_int32_color(c_struct):
@@ -209,13 +280,29 @@ class c_array_impl(c_type, List[TCTYPE]):
 
     @classmethod
     def from_data(cls, data: StringFile) -> 'c_array_impl[TCTYPE]':
-        return cls([cls._type.from_data(data) for _ in range(cls._length)])
+        return cls(cls._type.from_data_list(data, cls._length))
 
     def to_data(self):
-        b = b''
-        for x in self:
-            b += x.to_data()
-        return b
+        values: 'list[Any]' = []
+        self._to_values(self, values)
+        return struct.pack('<' + self._format(), *values)
+
+    @classmethod
+    def size_bytes(cls) -> int:
+        return cls._type.size_bytes() * cls._length
+
+    @classmethod
+    def _format(cls):
+        return cls._type._format() * cls._length
+
+    @classmethod
+    def _from_values(cls, values: Iterator[Any]):
+        return cls([cls._type._from_values(values) for _ in range(cls._length)])
+
+    @classmethod
+    def _to_values(cls, value: 'list[TCTYPE]', values: 'list[Any]'):
+        for x in value:
+            cls._type._to_values(x, values)
 
 
 class c_point_array5(c_array_impl[c_int32_point]):
@@ -1,39 +1,474 @@
-from typing import Optional
+from PIL import Image
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, NamedTuple, Optional, Sequence, Tuple, TypeVar, Union
+import numpy as np
 
 from pytwmap.constants import TileFlag
 
+if TYPE_CHECKING:
+    from pytwmap.datafile_reader import DataBlock
+
+
+TTILEMANAGER = TypeVar('TTILEMANAGER', bound='TileManager')
+
+# width and height of the chunks of sparse tile managers
+CHUNK_SIZE = 64
+
+# PyBUF_WRITABLE of the buffer protocol
+_BUFFER_WRITABLE = 1
+
+
+class TileRegions(NamedTuple):
+    labels: np.ndarray  # 1..count for the tiles of each region, 0 elsewhere
+    count: int
+    areas: np.ndarray
+    bboxes: np.ndarray  # (x, y, width, height) rows
+    centroids: np.ndarray  # (x, y) rows
+
+
+def _flip_flags_x(flags: np.ndarray):
+    # rotated tiles have their axes swapped
+    flags ^= np.where(flags & TileFlag.ROTATE, TileFlag.HFLIP, TileFlag.VFLIP).astype(flags.dtype)
+
+
+def _flip_flags_y(flags: np.ndarray):
+    flags ^= np.where(flags & TileFlag.ROTATE, TileFlag.VFLIP, TileFlag.HFLIP).astype(flags.dtype)
+
+
+def _rotate_flags(flags: np.ndarray):
+    # rotating twice by 90 degrees is the same as flipping both axes
+    flags ^= np.where(flags & TileFlag.ROTATE, TileFlag.VFLIP | TileFlag.HFLIP, 0).astype(flags.dtype)
+    flags ^= flags.dtype.type(TileFlag.ROTATE)
+
+
+def label_mask(mask: np.ndarray, connectivity: int = 4):
+    """Labels the connected regions of a mask, numbered by their first tile row by row."""
+    assert connectivity in [4, 8]
+    height, width = mask.shape
+    cells = np.flatnonzero(mask)
+    parent = np.arange(height * width, dtype=np.int64)
+
+    # pairs of neighbouring cells, every pair is only added in one direction
+    pairs = [(mask[:, :-1] & mask[:, 1:], 0, 1), (mask[:-1] & mask[1:], 1, 0)]
+    if connectivity == 8:
+        pairs += [(mask[:-1, :-1] & mask[1:, 1:], 1, 1), (mask[:-1, 1:] & mask[1:, :-1], 1, -1)]
+
+    sources, targets = [], []
+    for connected, dy, dx in pairs:
+        y, x = np.nonzero(connected)
+        if dx < 0:
+            x = x + 1
+        sources.append(y * width + x)
+        targets.append((y + dy) * width + x + dx)
+    a, b = np.concatenate(sources), np.concatenate(targets)
+
+    # union-find on arrays, the larger root is hooked to the smaller one
+    # and all paths are compressed until the pairs agree
+    while len(a):
+        root_a, root_b = parent[a], parent[b]
+        differ = root_a != root_b
+        a, b = a[differ], b[differ]
+        root_a, root_b = root_a[differ], root_b[differ]
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+
+        while True:
+            grand_parents = parent[parent[cells]]
+            if np.array_equal(grand_parents, parent[cells]):
+                break
+            parent[cells] = grand_parents
+
+    labels = np.zeros(height * width, dtype=np.int32)
+    roots, inverse = np.unique(parent[cells], return_inverse=True)
+    regions = inverse.ravel() + 1
+    labels[cells] = regions
+    count = len(roots)
+
+    xs, ys = cells % width, cells // width
+    areas = np.bincount(regions, minlength=count + 1)[1:]
+    x_min = np.full(count + 1, width, dtype=np.int64)
+    x_max = np.full(count + 1, -1, dtype=np.int64)
+    y_min = np.full(count + 1, height, dtype=np.int64)
+    y_max = np.full(count + 1, -1, dtype=np.int64)
+    np.minimum.at(x_min, regions, xs)
+    np.maximum.at(x_max, regions, xs)
+    np.minimum.at(y_min, regions, ys)
+    np.maximum.at(y_max, regions, ys)
+
+    return TileRegions(
+        labels=labels.reshape(height, width),
+        count=count,
+        areas=areas,
+        bboxes=np.stack([x_min, y_min, x_max - x_min + 1, y_max - y_min + 1], axis=1)[1:],
+        centroids=np.stack([np.bincount(regions, xs, count + 1), np.bincount(regions, ys, count + 1)], axis=1)[1:] / areas[:, np.newaxis]
+    )
+
+
+class _FieldIndex:
+    """Sorted positions (x + y * width) of the tiles with each value of a field.
+
+    Changes are collected in sets and merged into the arrays when the value is looked up.
+    """
+
+    def __init__(self, positions: 'dict[int, np.ndarray]'):
+        self._positions = positions
+        self._added: dict[int, set[int]] = {}
+        self._removed: dict[int, set[int]] = {}
+
+    def move(self, position: int, old_value: int, value: int):
+        # empty values are not indexed
+        if old_value:
+            added = self._added.get(old_value)
+            if added is not None and position in added:
+                added.discard(position)
+            else:
+                self._removed.setdefault(old_value, set()).add(position)
+        if value:
+            removed = self._removed.get(value)
+            if removed is not None and position in removed:
+                removed.discard(position)
+            else:
+                self._added.setdefault(value, set()).add(position)
+
+    def get(self, value: int) -> np.ndarray:
+        positions = self._positions.get(value, np.zeros(0, dtype=np.int64))
+        added, removed = self._added.pop(value, None), self._removed.pop(value, None)
+        if removed:
+            positions = positions[~np.isin(positions, np.fromiter(removed, dtype=np.int64))]
+        if added:
+            # the added positions are not in the array yet
+            added_positions = np.sort(np.fromiter(added, dtype=np.int64))
+            positions = np.insert(positions, np.searchsorted(positions, added_positions), added_positions)
+        if added or removed:
+            self._positions[value] = positions
+        return positions
+
 
 class TileManager:
+    _dtype: np.dtype
     _tile_bytes: int
 
-    def __init__(self, width: int, height: int, data: Optional[bytes] = None):
+    # fields that can be searched with find, get_id reads the first one
+    _index_fields: 'Tuple[str, ...]'
+
+    def __init__(self,
+                 width: int,
+                 height: int,
+                 data: Optional[bytes] = None,
+                 block: 'Optional[DataBlock]' = None,
+                 sparse: bool = False):
         needed_bytes = width * height * self._tile_bytes
-        if data is None:
-            self._data = bytearray(needed_bytes)
-        else:
-            self._data = bytearray(data)
-        assert len(self._data) == needed_bytes
         self._width = width
         self._height = height
+        self._data: Optional[bytearray] = None
+
+        # if sparse is set only the chunks containing tiles are allocated,
+        # they are merged into the dense buffer once it is accessed
+        self._sparse = sparse
+        self._chunks: Optional[dict[tuple[int, int], np.ndarray]] = None
+
+        # compressed block the tiles were loaded from, dropped once they are modified
+        self._block = block
+        if block is not None:
+            assert block.size == needed_bytes
+
+        # positions of the tiles for every value of the indexed fields
+        self._index: Optional[dict[str, _FieldIndex]] = None
+
+        # counts the changes, caches built from the tiles compare it
+        self._revision = 0
+
+        if data is not None:
+            assert len(data) == needed_bytes
+            self._load(data)
+        elif block is None:
+            self._load(None)
+        # otherwise the block is decompressed on first access
+
+    def _load(self, data: Optional[bytes]):
+        if self._sparse:
+            self._chunks = self._chunks_from_dense(data) if data is not None else {}
+        elif data is not None:
+            self._data = bytearray(data)
+        else:
+            self._data = bytearray(self._width * self._height * self._tile_bytes)
+
+    def _decompress(self):
+        assert self._block is not None
+        data = self._block.decompress()
+        assert len(data) == self._width * self._height * self._tile_bytes
+        return data
+
+    @property
+    def _buffer(self) -> bytearray:
+        if self._data is None:
+            if self._chunks is not None:
+                self._data = bytearray(self._dense_from_chunks().data)
+                self._chunks = None
+                self._sparse = False
+            else:
+                self._sparse = False
+                self._load(self._decompress())
+        assert self._data is not None
+        return self._data
+
+    @property
+    def _sparse_chunks(self):
+        if self._chunks is None:
+            self._load(self._decompress())
+        assert self._chunks is not None
+        return self._chunks
+
+    def _chunks_from_dense(self, data: bytes):
+        tiles = np.frombuffer(data, dtype=np.uint8).reshape(self._height, self._width, self._tile_bytes)
+        chunks: dict[tuple[int, int], np.ndarray] = {}
+        for y in range(0, self._height, CHUNK_SIZE):
+            for x in range(0, self._width, CHUNK_SIZE):
+                block = tiles[y:y + CHUNK_SIZE, x:x + CHUNK_SIZE]
+                if block.any():
+                    chunk = self._new_chunk()
+                    chunk[:block.shape[0], :block.shape[1]] = block
+                    chunks[(y // CHUNK_SIZE, x // CHUNK_SIZE)] = chunk
+        return chunks
+
+    def _dense_from_chunks(self) -> np.ndarray:
+        tiles = np.zeros((self._height, self._width, self._tile_bytes), dtype=np.uint8)
+        for (chunk_y, chunk_x), chunk in self._sparse_chunks.items():
+            y, x = chunk_y * CHUNK_SIZE, chunk_x * CHUNK_SIZE
+            block = tiles[y:y + CHUNK_SIZE, x:x + CHUNK_SIZE]
+            block[...] = chunk[:block.shape[0], :block.shape[1]]
+        return tiles
+
+    def _new_chunk(self):
+        return np.zeros((CHUNK_SIZE, CHUNK_SIZE, self._tile_bytes), dtype=np.uint8)
+
+    @property
+    def sparse(self):
+        return self._sparse
+
+    @property
+    def loaded(self):
+        return self._data is not None or self._chunks is not None
+
+    def mark_dirty(self):
+        # the index cannot follow changes made through array or raw_data
+        self._block = None
+        self._index = None
+        self._revision += 1
+
+    @property
+    def dirty(self):
+        return self._block is None
+
+    @property
+    def revision(self):
+        return self._revision
+
+    @property
+    def source_block(self):
+        return self._block
+
+    def dense_data(self) -> 'Union[bytes, bytearray, memoryview]':
+        # tiles in the layout of the datafile, sparse tiles are not converted
+        if not self._sparse:
+            return self._buffer
+        if self._chunks is None:
+            return self._decompress()
+        return self._dense_from_chunks().data
 
     def _check_coords(self, x: int, y: int):
-        assert 0 <= x <= self._width
-        assert 0 <= y <= self._height
+        assert 0 <= x < self._width
+        assert 0 <= y < self._height
 
     def _set_field(self, x: int, y: int, num_byte: int, value: int):
         self._check_coords(x, y)
         assert 0 <= num_byte < self._tile_bytes
         assert 0 <= value < 256
 
-        begin = (x + y * self._width) * self._tile_bytes
-        self._data[begin+num_byte] = value
+        if self._index is not None:
+            self._update_index(x, y, num_byte, value)
+
+        if self._sparse:
+            key = (y // CHUNK_SIZE, x // CHUNK_SIZE)
+            chunk = self._sparse_chunks.get(key)
+            if chunk is None:
+                if value == 0:
+                    return
+                chunk = self._sparse_chunks[key] = self._new_chunk()
+            chunk[y % CHUNK_SIZE, x % CHUNK_SIZE, num_byte] = value
+        else:
+            begin = (x + y * self._width) * self._tile_bytes
+            self._buffer[begin+num_byte] = value
+        self._block = None
+        self._revision += 1
 
     def _get_field(self, x: int, y: int, num_byte: int):
         self._check_coords(x, y)
         assert 0 <= num_byte < self._tile_bytes
 
+        if self._sparse:
+            chunk = self._sparse_chunks.get((y // CHUNK_SIZE, x // CHUNK_SIZE))
+            if chunk is None:
+                return 0
+            return int(chunk[y % CHUNK_SIZE, x % CHUNK_SIZE, num_byte])
+
         begin = (x + y * self._width) * self._tile_bytes
-        return self._data[begin+num_byte]
+        return self._buffer[begin+num_byte]
+
+    @property
+    def indexed(self):
+        return self._index is not None
+
+    def _field_blocks(self, field: str) -> 'Iterator[Tuple[int, int, np.ndarray]]':
+        # values of a field with the position of their top left tile
+        if not self._sparse:
+            yield 0, 0, self._array[field]
+            return
+
+        offset = self._dtype.fields[field][1]
+        for (chunk_y, chunk_x), chunk in self._sparse_chunks.items():
+            yield chunk_y * CHUNK_SIZE, chunk_x * CHUNK_SIZE, chunk[:, :, offset]
+
+    def build_index(self):
+        # empty values are not indexed
+        self._index = {}
+        for field in self._index_fields:
+            found_values: list[np.ndarray] = []
+            found_positions: list[np.ndarray] = []
+            for y, x, values in self._field_blocks(field):
+                ys, xs = np.nonzero(values)
+                found_values.append(values[ys, xs])
+                found_positions.append((ys + y) * self._width + (xs + x))
+
+            found = np.concatenate(found_values) if found_values else np.zeros(0, dtype=np.uint8)
+            positions = np.concatenate(found_positions).astype(np.int64) if found_positions else np.zeros(0, dtype=np.int64)
+            order = np.lexsort((positions, found))
+            found, positions = found[order], positions[order]
+            keys, starts = np.unique(found, return_index=True)
+            groups = np.split(positions, starts[1:]) if len(keys) else []
+            self._index[field] = _FieldIndex(dict(zip(keys.tolist(), groups)))
+
+    def _update_index(self, x: int, y: int, num_byte: int, value: int):
+        assert self._index is not None
+        for field in self._index_fields:
+            if self._dtype.fields[field][1] != num_byte:
+                continue
+
+            old_value = self._get_field(x, y, num_byte)
+            if old_value != value:
+                self._index[field].move(x + y * self._width, old_value, value)
+            return
+
+    def find(self, value: int, field: Optional[str] = None) -> np.ndarray:
+        # (x, y) positions of the tiles with the value, ordered by row
+        if field is None:
+            field = self._index_fields[0]
+        assert field in self._index_fields
+
+        if value == 0:
+            values = self.read_array()[field]
+            ys, xs = np.nonzero(values == 0)
+            return np.stack([xs, ys], axis=1)
+
+        if self._index is None:
+            self.build_index()
+        assert self._index is not None
+
+        positions = self._index[field].get(value)
+        return np.stack([positions % self._width, positions // self._width], axis=1)
+
+    def label_regions(self,
+                      value: 'Union[int, Sequence[int], Callable[[np.ndarray], np.ndarray]]',
+                      field: Optional[str] = None,
+                      connectivity: int = 4):
+        # connected regions of the tiles with one of the values,
+        # or of the tiles a function of the read-only tile array selects
+        tiles = self.read_array()
+        if callable(value):
+            mask = np.asarray(value(tiles), dtype=bool)
+        else:
+            if field is None:
+                field = self._index_fields[0]
+            mask = np.isin(tiles[field], value)
+        assert mask.shape == (self._height, self._width)
+
+        return label_mask(mask, connectivity)
+
+    @staticmethod
+    def _pack_colors(pixels: np.ndarray, channels: int):
+        # every color is packed into one integer to compare them at once
+        packed = np.zeros(pixels.shape[:2], dtype=np.int64)
+        for channel in range(channels):
+            packed = (packed << 8) | pixels[:, :, channel]
+        return packed
+
+    def fill_from_image(self,
+                        image: 'Union[Image.Image, np.ndarray]',
+                        threshold: Optional[int] = None,
+                        value: int = 1,
+                        palette: 'Optional[Dict[Union[int, Tuple[int, ...]], int]]' = None,
+                        channel: int = -1,
+                        field: Optional[str] = None,
+                        resize: bool = True):
+        # sets one field of every tile from the pixel at the same position:
+        # with a threshold to value where the channel (alpha by default) reaches it,
+        # with a palette to the value of the pixel color, otherwise to the pixel itself
+        if field is None:
+            field = self._index_fields[0]
+        color_keys = palette is not None and any(isinstance(key, tuple) for key in palette)
+        index_palette = threshold is None and palette is not None and not color_keys
+        if isinstance(image, Image.Image) and not (image.mode == 'P' and index_palette):
+            # grayscale images stay single channel, thresholds and palettes apply to their values,
+            # palette images keep their indices for palettes with int keys
+            single_channel = image.mode in ['1', 'L'] or (threshold is None and palette is None)
+            image = image.convert('L' if single_channel else 'RGBA')
+        pixels = np.asarray(image)
+        assert pixels.ndim in [2, 3]
+
+        height, width = pixels.shape[:2]
+        if (width, height) != (self._width, self._height):
+            assert resize, 'image size does not match the layer'
+            self.resize(width, height)
+
+        if threshold is not None:
+            channel_pixels = pixels if pixels.ndim == 2 else pixels[:, :, channel]
+            values = np.where(channel_pixels >= threshold, value, 0)
+        elif palette is not None:
+            if pixels.ndim == 3:
+                assert color_keys, 'the palette of a color image needs color tuples as keys'
+                # colors with three channels ignore the alpha channel
+                channels = len(next(iter(palette)))  # type: ignore
+                colors = np.array(list(palette), dtype=np.int64).reshape(1, -1, channels)
+                keys = self._pack_colors(colors, channels)[0]
+                packed = self._pack_colors(pixels, channels)
+            else:
+                keys = np.array(list(palette), dtype=np.int64)
+                packed = pixels.astype(np.int64)
+
+            ids = np.array(list(palette.values()), dtype=np.int64)
+            order = np.argsort(keys)
+            keys, ids = keys[order], ids[order]
+            found = np.searchsorted(keys, packed).clip(0, len(keys) - 1)
+            values = np.where(keys[found] == packed, ids[found], 0)
+        else:
+            assert pixels.ndim == 2, 'a threshold or palette is needed for color images'
+            values = pixels
+
+        assert values.min(initial=0) >= 0 and values.max(initial=0) < 256
+        self.array[field] = values
+
+    def to_image(self, field: Optional[str] = None, palette: 'Optional[Dict[int, Tuple[int, int, int, int]]]' = None):
+        # grayscale image of the field values, or with a palette a rgba image
+        # where values that are not in it are transparent
+        if field is None:
+            field = self._index_fields[0]
+        values = self.read_array()[field]
+
+        if palette is None:
+            return Image.fromarray(np.ascontiguousarray(values), 'L')
+
+        lookup = np.zeros((256, 4), dtype=np.uint8)
+        for tile_value, color in palette.items():
+            lookup[tile_value] = color
+        return Image.fromarray(lookup[values], 'RGBA')
 
     def get_id(self, x: int, y: int) -> int:
         raise NotImplementedError()
@@ -41,12 +476,47 @@ class TileManager:
     def set_id(self, x: int, y: int, value: int) -> None:
         raise NotImplementedError()
 
-    def resize(self, new_width: int, new_height: int):
-        # TODO: keep already existing tiles
-        needed_bytes = new_width * new_height * self._tile_bytes
+    def resize(self, new_width: int, new_height: int, x_offset: int = 0, y_offset: int = 0):
+        # existing tiles are moved by the offset, tiles outside of the new size are lost
+        assert new_width > 0 and new_height > 0
+
+        if self._sparse:
+            self._chunks = self._moved_chunks(new_width, new_height, x_offset, y_offset)
+        else:
+            resized = np.zeros((new_height, new_width), dtype=self._dtype)
+            x_begin, y_begin = max(x_offset, 0), max(y_offset, 0)
+            x_end, y_end = min(x_offset + self._width, new_width), min(y_offset + self._height, new_height)
+            if x_begin < x_end and y_begin < y_end:
+                resized[y_begin:y_end, x_begin:x_end] = self._array[y_begin - y_offset:y_end - y_offset, x_begin - x_offset:x_end - x_offset]
+            self._data = bytearray(resized.data)
+
         self._width = new_width
         self._height = new_height
-        self._data = bytearray(needed_bytes)
+        self.mark_dirty()
+
+    def _moved_chunks(self, new_width: int, new_height: int, x_offset: int, y_offset: int):
+        # only the tiles that are not empty are moved into the new chunks
+        chunks: dict[tuple[int, int], np.ndarray] = {}
+        for (chunk_y, chunk_x), chunk in self._sparse_chunks.items():
+            ys, xs = np.nonzero(chunk.any(axis=2))
+            tiles = chunk[ys, xs]
+            ys = ys + (chunk_y * CHUNK_SIZE + y_offset)
+            xs = xs + (chunk_x * CHUNK_SIZE + x_offset)
+
+            inside = (ys >= 0) & (ys < new_height) & (xs >= 0) & (xs < new_width)
+            ys, xs, tiles = ys[inside], xs[inside], tiles[inside]
+
+            keys_y, keys_x = ys // CHUNK_SIZE, xs // CHUNK_SIZE
+            for key in set(zip(keys_y.tolist(), keys_x.tolist())):
+                if key not in chunks:
+                    chunks[key] = self._new_chunk()
+                selected = (keys_y == key[0]) & (keys_x == key[1])
+                chunks[key][ys[selected] % CHUNK_SIZE, xs[selected] % CHUNK_SIZE] = tiles[selected]
+        return chunks
+
+    def expand(self, left: int = 0, top: int = 0, right: int = 0, bottom: int = 0):
+        # grows each side by the given number of tiles, negative values shrink it
+        self.resize(self._width + left + right, self._height + top + bottom, left, top)
 
     @property
     def width(self):
@@ -58,11 +528,150 @@ class TileManager:
 
     @property
     def raw_data(self):
-        return self._data
+        # the returned buffer can be modified
+        buffer = self._buffer
+        self.mark_dirty()
+        return buffer
+
+    @property
+    def _array(self) -> np.ndarray:
+        # view of the buffer, reading it does not mark the tiles as modified
+        return np.frombuffer(self._buffer, dtype=self._dtype).reshape(self._height, self._width)
+
+    @property
+    def array(self):
+        # structured array of shape (height, width), it shares memory with raw_data
+        # and can be modified, e.g. array['id'][array['id'] == 1] = 3
+        array = self._array
+        self.mark_dirty()
+        return array
+
+    def view(self, y_begin: int = 0, y_end: Optional[int] = None, readonly: bool = True):
+        # rows of tiles with shape (rows, width, tile_bytes) sharing memory with raw_data,
+        # columns can be sliced without copying through numpy.asarray
+        if y_end is None:
+            y_end = self._height
+        assert 0 <= y_begin <= y_end <= self._height
+
+        row_bytes = self._width * self._tile_bytes
+        rows = memoryview(self._buffer)[y_begin * row_bytes:y_end * row_bytes]
+        rows = rows.cast('B', (y_end - y_begin, self._width, self._tile_bytes))
+        if readonly:
+            return rows.toreadonly()
+
+        self.mark_dirty()
+        return rows
+
+    def __buffer__(self, flags: int):
+        # buffer protocol of python 3.12, e.g. memoryview(tiles)
+        return self.view(readonly=not flags & _BUFFER_WRITABLE)
+
+    def read_array(self) -> np.ndarray:
+        # read-only structured array of shape (height, width), it shares memory with raw_data,
+        # sparse tiles are not converted, they are merged into a temporary array
+        array = np.frombuffer(self.dense_data(), dtype=self._dtype).reshape(self._height, self._width)
+        array.flags.writeable = False
+        return array
+
+    def __array__(self, dtype: Optional[np.dtype] = None, copy: Optional[bool] = None):
+        # read-only structured array for numpy.asarray, array can be modified
+        array = self.read_array()
+        if copy:
+            array = array.copy()
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def _check_region(self, x: int, y: int, width: int, height: int):
+        assert width >= 0 and height >= 0
+        assert 0 <= x and x + width <= self._width
+        assert 0 <= y and y + height <= self._height
+        return slice(y, y + height), slice(x, x + width)
+
+    def _flip_x_tiles(self, tiles: np.ndarray):
+        pass  # tiles without orientation
+
+    def _flip_y_tiles(self, tiles: np.ndarray):
+        pass
+
+    def _rotate_tiles(self, tiles: np.ndarray):
+        pass
+
+    def fill_rect(self, x: int, y: int, width: int, height: int, **fields: int):
+        # only the given fields are set, e.g. fill_rect(0, 0, 5, 5, id=1, flags=0)
+        rows, cols = self._check_region(x, y, width, height)
+        region = self.array[rows, cols]
+        for name, value in fields.items():
+            region[name] = value
+
+    def copy_region(self: TTILEMANAGER, x: int, y: int, width: int, height: int) -> TTILEMANAGER:
+        rows, cols = self._check_region(x, y, width, height)
+        return type(self)(width, height, data=self._array[rows, cols].tobytes())
+
+    def paste(self, source: 'TileManager', x: int, y: int, mask: Optional[np.ndarray] = None):
+        # parts of the source outside of this layer are cut off,
+        # with a mask only the tiles where it is set are copied
+        assert source._dtype == self._dtype
+        if mask is not None:
+            assert mask.shape == (source.height, source.width)
+
+        x_begin, y_begin = max(x, 0), max(y, 0)
+        x_end, y_end = min(x + source.width, self._width), min(y + source.height, self._height)
+        if x_begin >= x_end or y_begin >= y_end:
+            return
+
+        src_rows = slice(y_begin - y, y_end - y)
+        src_cols = slice(x_begin - x, x_end - x)
+        src = source._array[src_rows, src_cols]
+        dst = self.array[y_begin:y_end, x_begin:x_end]
+        if mask is None:
+            dst[...] = src
+        else:
+            region_mask = mask[src_rows, src_cols]
+            dst[region_mask] = src[region_mask]
+
+    def flip_x(self, x: int = 0, y: int = 0, width: Optional[int] = None, height: Optional[int] = None):
+        # mirrors the region horizontally, the whole layer by default
+        rows, cols = self._check_region(x, y, self._width - x if width is None else width, self._height - y if height is None else height)
+        region = self.array[rows, cols]
+        region[...] = region[:, ::-1].copy()
+        self._flip_x_tiles(region)
+
+    def flip_y(self, x: int = 0, y: int = 0, width: Optional[int] = None, height: Optional[int] = None):
+        # mirrors the region vertically, the whole layer by default
+        rows, cols = self._check_region(x, y, self._width - x if width is None else width, self._height - y if height is None else height)
+        region = self.array[rows, cols]
+        region[...] = region[::-1, :].copy()
+        self._flip_y_tiles(region)
+
+    def rotate(self):
+        # rotates the whole layer clockwise, this swaps width and height,
+        # regions can be rotated with copy_region and paste
+        rotated = np.ascontiguousarray(np.rot90(self._array, k=-1))
+        self._rotate_tiles(rotated)
+        self._width, self._height = self._height, self._width
+        self._data = bytearray(rotated.tobytes())
+        self.mark_dirty()
+
+    def shift(self, dx: int, dy: int):
+        # moves all tiles, tiles moved outside are lost and the free space is emptied
+        array = self.array
+        moved = np.zeros_like(array)
+        src_rows = slice(max(-dy, 0), max(self._height - dy, 0))
+        src_cols = slice(max(-dx, 0), max(self._width - dx, 0))
+        dst_rows = slice(max(dy, 0), max(self._height + dy, 0))
+        dst_cols = slice(max(dx, 0), max(self._width + dx, 0))
+        moved[dst_rows, dst_cols] = array[src_rows, src_cols]
+        array[...] = moved
+
+    def scroll(self, dx: int, dy: int):
+        # moves all tiles, tiles moved outside wrap around
+        array = self.array
+        array[...] = np.roll(array, (dy, dx), axis=(0, 1))
 
 
 class VanillaTileManager(TileManager):
-    _tile_bytes = 4
+    _dtype = np.dtype([('id', 'u1'), ('flags', 'u1'), ('skip', 'u1'), ('reserved', 'u1')])
+    _tile_bytes = _dtype.itemsize
+    _index_fields = ('id',)
 
     def get_id(self, x: int, y: int):
         return self._get_field(x, y, 0)
@@ -73,30 +682,96 @@ class VanillaTileManager(TileManager):
     def has_flag(self, x: int, y: int, f: TileFlag):
         return f & self._get_field(x, y, 1) > 0
 
+    def _flip_x_tiles(self, tiles: np.ndarray):
+        _flip_flags_x(tiles['flags'])
+
+    def _flip_y_tiles(self, tiles: np.ndarray):
+        _flip_flags_y(tiles['flags'])
+
+    def _rotate_tiles(self, tiles: np.ndarray):
+        _rotate_flags(tiles['flags'])
+
 
 class TeleTileManager(TileManager):
-    _tile_bytes = 2
+    _dtype = np.dtype([('number', 'u1'), ('type', 'u1')])
+    _tile_bytes = _dtype.itemsize
+    _index_fields = ('type', 'number')
 
     def get_id(self, x: int, y: int) -> int:
         return self._get_field(x, y, 1)
 
+    def set_id(self, x: int, y: int, value: int):
+        return self._set_field(x, y, 1, value)
+
+    def get_number(self, x: int, y: int) -> int:
+        return self._get_field(x, y, 0)
+
+    def set_number(self, x: int, y: int, value: int):
+        return self._set_field(x, y, 0, value)
+
 
 class SpeedupTileManager(TileManager):
-    _tile_bytes = 6
+    _dtype = np.dtype([('force', 'u1'), ('max_speed', 'u1'), ('type', 'u1'), ('pad', 'u1'), ('angle', '<i2')])
+    _tile_bytes = _dtype.itemsize
+    _index_fields = ('type',)
 
     def get_id(self, x: int, y: int) -> int:
-        return self._get_field(x, y, 1)
+        return self._get_field(x, y, 2)
+
+    def set_id(self, x: int, y: int, value: int):
+        return self._set_field(x, y, 2, value)
+
+    # angles are in degrees, clockwise as the y axis points down
+    def _flip_x_tiles(self, tiles: np.ndarray):
+        tiles['angle'] = (180 - tiles['angle']) % 360
+
+    def _flip_y_tiles(self, tiles: np.ndarray):
+        tiles['angle'] = -tiles['angle'] % 360
+
+    def _rotate_tiles(self, tiles: np.ndarray):
+        tiles['angle'] = (tiles['angle'] + 90) % 360
 
 
 class SwitchTileManager(TileManager):
-    _tile_bytes = 4
+    _dtype = np.dtype([('number', 'u1'), ('type', 'u1'), ('flags', 'u1'), ('delay', 'u1')])
+    _tile_bytes = _dtype.itemsize
+    _index_fields = ('type', 'number')
 
     def get_id(self, x: int, y: int) -> int:
         return self._get_field(x, y, 1)
 
+    def set_id(self, x: int, y: int, value: int):
+        return self._set_field(x, y, 1, value)
+
+    def get_number(self, x: int, y: int) -> int:
+        return self._get_field(x, y, 0)
+
+    def set_number(self, x: int, y: int, value: int):
+        return self._set_field(x, y, 0, value)
+
+    def _flip_x_tiles(self, tiles: np.ndarray):
+        _flip_flags_x(tiles['flags'])
+
+    def _flip_y_tiles(self, tiles: np.ndarray):
+        _flip_flags_y(tiles['flags'])
+
+    def _rotate_tiles(self, tiles: np.ndarray):
+        _rotate_flags(tiles['flags'])
+
 
 class TuneTileManager(TileManager):
-    _tile_bytes = 2
+    _dtype = np.dtype([('number', 'u1'), ('type', 'u1')])
+    _tile_bytes = _dtype.itemsize
+    _index_fields = ('type', 'number')
 
     def get_id(self, x: int, y: int) -> int:
         return self._get_field(x, y, 1)
+
+    def set_id(self, x: int, y: int, value: int):
+        return self._set_field(x, y, 1, value)
+
+    def get_number(self, x: int, y: int) -> int:
+        return self._get_field(x, y, 0)
+
+    def set_number(self, x: int, y: int, value: int):
+        return self._set_field(x, y, 0, value)
@@ -1,7 +1,9 @@
-from typing import Optional
-from pytwmap.datafile_reader import DataFileReader
+import os
+import zlib
+from typing import BinaryIO, Optional, Union
+from pytwmap.datafile_reader import DataFileReader, TFile
 from pytwmap.datafile_writer import DataFileWriter
-from pytwmap.items import ItemQuadLayer, ItemSoundLayer, ItemVersion, ItemInfo, ItemTileLayer, ItemGroup
+from pytwmap.items import ItemEnvelope, ItemImage, ItemQuadLayer, ItemRaw, ItemSound, ItemSoundLayer, ItemVersion, ItemInfo, ItemTileLayer, ItemGroup
 from pytwmap.tilemanager import SpeedupTileManager, SwitchTileManager, TeleTileManager, TuneTileManager, VanillaTileManager
 
 
@@ -29,12 +31,49 @@ class TWMap:
             name='Game'
         )]
 
-    def open(self, path: str):
-        with open(path, 'rb') as file:
-            data = DataFileReader(file.read())
+        # images are kept in their order even if no layer uses them
+        self._images: list[ItemImage] = []
 
+        # envelopes and sounds are referenced by index, their order is kept
+        self.envelopes: list[ItemEnvelope] = []
+        self.sounds: list[ItemSound] = []
+
+        # items that are not parsed, they are saved as they were loaded
+        self.raw_items: list[ItemRaw] = []
+
+        # the file the map was opened from, unmodified data blocks are read from it
+        self._reader: Optional[DataFileReader] = None
+
+    def open(self, file: TFile, lazy: bool = False, workers: int = 1, sparse: bool = False, index: bool = False):
+        # the file stays open until close, unmodified blocks are copied as they are when saving
+        self.close()
+        self._reader = DataFileReader(file, lazy=lazy, workers=workers, sparse=sparse, index=index)
+        self._load(self._reader)
+
+    def close(self):
+        # the items stay usable, the data blocks they still reference are copied from the file
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: object):
+        self.close()
+
+    @staticmethod
+    def inspect(file: TFile):
+        with DataFileReader(file) as data:
+            return data.scan()
+
+    def _load(self, data: DataFileReader):
         self.version = data.get_version()
         self.info = data.get_info()
+        self.images = data.get_images()
+        self.envelopes = data.get_envelopes()
+        self.sounds = data.get_sounds()
+        self.raw_items = data.get_raw_items()
 
         self.groups = data.get_groups()
 
@@ -48,8 +87,17 @@ class TWMap:
         self.switch_layer = data.switch_layer
         self.tune_layer = data.tune_layer
 
-    def save(self, path: str):
-        data = DataFileWriter()
+        # the reader must not keep the items alive, they reference it through their data blocks
+        data.clear_items()
+
+    def save(self,
+             file: 'Union[str, os.PathLike[str], BinaryIO]',
+             level: int = zlib.Z_DEFAULT_COMPRESSION,
+             strategy: int = zlib.Z_DEFAULT_STRATEGY,
+             wbits: int = zlib.MAX_WBITS,
+             workers: int = 1):
+        # use level 1 for fast saves and level 9 for the smallest files
+        data = DataFileWriter(level=level, strategy=strategy, wbits=wbits, workers=workers)
 
         data.set_special_layers(
             self.game_layer,
@@ -63,20 +111,38 @@ class TWMap:
         data.register_version(self.version)
         data.register_info(self.info)
 
+        for image in self.images:
+            data.register_image(image)
+
+        # quads reference envelopes by index, they are registered first
+        for envelope in self.envelopes:
+            data.register_envelope(envelope)
+        for sound in self.sounds:
+            data.register_sound(sound)
+        for item in self.raw_items:
+            data.register_raw_item(item)
+
         for group in self.groups:
             data.register_group(group)
 
-        return data.write(path)
+        return data.write(file)
 
     def _images_generator(self):
+        yield from self._images
+
         for layer in self.layers:
             if isinstance(layer, ItemTileLayer) or isinstance(layer, ItemQuadLayer):
-                if layer.image is not None:
+                if layer.image is not None and layer.image not in self._images:
                     yield layer.image
 
     @property
     def images(self):
-        return list(self._images_generator())
+        return list(dict.fromkeys(self._images_generator()))
+
+    @images.setter
+    def images(self, images: 'list[ItemImage]'):
+        # images that are not in this list are still saved if a layer uses them
+        self._images = list(images)
 
     def _layers_generator(self):
         for group in self.groups:
@@ -105,6 +171,15 @@ class TWMap:
     def gameplay_layers(self):
         return list(self._gameplay_layers_generator())
 
+    def resize_gameplay_layers(self, new_width: int, new_height: int, x_offset: int = 0, y_offset: int = 0):
+        # all gameplay layers need to have the same size
+        for layer in self.gameplay_layers:
+            layer.tiles.resize(new_width, new_height, x_offset, y_offset)
+
+    def expand_gameplay_layers(self, left: int = 0, top: int = 0, right: int = 0, bottom: int = 0):
+        for layer in self.gameplay_layers:
+            layer.tiles.expand(left, top, right, bottom)
+
     @property
     def game_layer(self):
         if self._game_layer is None: